@@ -0,0 +1,932 @@
+"""
+催款数据处理流程（与界面无关）：读取原始数据 -> 清洗筛选 -> 剔除 -> 匹配分公司 / 补充客户经理
+-> 计算回款天数 -> 生成 30/60/90 天通报和数据汇总 -> 写出结果 Excel。
+
+用法：
+    单次处理：python excel_pipeline.py run --raw 原始数据.xlsx --dims 维度表.xlsx [--exclude 剔除.xlsx] --output 目录
+             [--as-of 2024-06-30] [--engine polars]
+    并行处理：python excel_pipeline.py run --raw 区域A.xlsx 区域B.xlsx ... --dims ... --output 目录 [--jobs 4]
+             （每个文件一个进程，日志分别写到 保存文件夹/<文件名>.log）
+    账龄回溯：python excel_pipeline.py backfill --raw ... --dims ... --output 目录 --start 2024-01-01 --end 2024-06-30
+             [--freq D]
+    监控目录：python excel_pipeline.py watch --input 目录 --dims 维度表.xlsx [--exclude 剔除.xlsx] --output 目录
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import re
+import time
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+
+import excel_reader
+
+# =============== 可选依赖：pyarrow（parquet 缓存）==========
+try:
+    import pyarrow
+    PARQUET_AVAILABLE = True
+except Exception:
+    pyarrow = None
+    PARQUET_AVAILABLE = False
+
+# ================== 处理流程配置 ===========================
+PIPELINE_CONFIG = {
+    # 原始数据解析缓存：按文件内容哈希缓存清洗后的数据，同一原始文件再次处理时跳过 Excel 解析
+    "raw_cache": True,
+    "raw_cache_dir": os.path.join(os.path.expanduser("~"), ".excel_processing", "raw_cache"),
+    "raw_cache_max_mb": 1024,
+    # Excel 解析引擎：auto（有 python-calamine 时用 calamine，否则 openpyxl）/ calamine / openpyxl
+    "excel_engine": "auto",
+    # 输入读取方式：process（多进程并行，适合 openpyxl 等纯 Python 解析）/ thread（多线程）/ off（依次读取）
+    "parallel_load": "process",
+    # 处理引擎：pandas / polars（excel_polars，惰性查询、多线程流式执行，结果与 pandas 相同；未安装 polars 时退回 pandas）
+    "engine": "pandas",
+}
+
+UNKNOWN = '未知'
+# 结果文件名前缀（监控模式据此跳过输出目录与监控目录相同时生成的结果文件）
+RESULT_PREFIX = "催款处理结果_"
+TREND_PREFIX = "账龄趋势_"
+
+PAYMENT_TYPES = ["小于30天", "大于30天并小于等于60天", "大于60天并小于等于90天", "大于90天"]
+# 催款类型的天数上界（含），依次对应 PAYMENT_TYPES 的前三类
+AGING_BOUNDS = [30, 60, 90]
+
+NOTICE_COLUMNS = ['补充客户经理', '客户经理电话', '催款类型', '客户名称', '开票日期', '发票号码', '发票总金额',
+                  '收票日期', '短信模板', '总监', '分管领导', '总监电话', '分管领导电话']
+
+# 通报 Sheet：(Sheet 名, 催款类型, 天数, 是否填总监, 是否填分管领导)
+NOTICE_SHEETS = [
+    ("30天通报", "大于30天并小于等于60天", 30, False, False),
+    ("60天通报", "大于60天并小于等于90天", 60, True, False),
+    ("90天通报", "大于90天", 90, True, True),
+]
+
+MESSAGE_TEMPLATE = ("客户经理{manager}名下{customer}于{date}开具发票，票号{invoice}，金额{amount}，"
+                    "逾期未回款{days}天以上，请尽快回款，如客户违约拒不回款的，应及时与客户确认后冲红发票。")
+
+
+# ================== 读取 ===========================
+def clean_raw(df: pd.DataFrame, log=print) -> pd.DataFrame:
+    """原始数据表头处理与筛选：已开具、金额 > 0、未完全销账，按发票号码去重"""
+    df_copy = df.copy()
+    log(df_copy.head(5))
+    log(df_copy.shape)
+
+    # 处理表头
+    df_copy = df_copy.drop(0)
+    df_copy.columns = df_copy.iloc[0]
+    df_copy = df_copy.iloc[1:].reset_index(drop=True)
+
+    # S列字段数据【发票状态】=已开具
+    df_copy = df_copy[df_copy['发票状态'] == '已开具']
+
+    # 【发票总金额】格式类型，要从文本变为数字 并筛选【发票总金额】>0
+    df_copy['发票总金额'] = df_copy['发票总金额'].astype(str).apply(lambda x: re.sub(r'[^\d.-]', '', x))
+    df_copy['发票总金额'] = pd.to_numeric(df_copy['发票总金额'], errors='coerce')
+    # 检查是否有转换失败的NaN值
+    na_count = df_copy['发票总金额'].isna().sum()
+    if na_count > 0:
+        log(f"注意：有{na_count}条数据转换失败，已设为NaN")
+    # 检查负数保留情况
+    negative_count = (df_copy['发票总金额'] < 0).sum()
+    log(f"转换后保留的负数数量: {negative_count}")
+    df_copy = df_copy[df_copy['发票总金额'] > 0]
+
+    # L列字段【是否完全销账】选择"否"
+    df_copy = df_copy[df_copy['是否已完全销账'] == '否']
+
+    # 按P列【发票号码】去重，相同的发票号仅保留一个
+    return df_copy.drop_duplicates(subset=['发票号码'], keep='first')
+
+
+class RawCache:
+    """
+    清洗后原始数据的磁盘缓存：键为原始文件内容的 SHA-1（加上清洗逻辑版本和 Excel 解析引擎），
+    有 pyarrow 且能原样还原时存为 parquet，否则（无 pyarrow、列名非字符串、object 列混有数字或空值）存为 pickle。
+    总大小超过 max_bytes 时按最近使用时间淘汰最旧的条目。
+    """
+
+    # clean_raw 的逻辑变化时递增，使旧缓存失效
+    VERSION = 1
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path: str, engine: str = None) -> str:
+        """engine 默认取 PIPELINE_CONFIG['excel_engine'] 实际使用的引擎；不同引擎解析的结果分别缓存"""
+        engine = excel_reader.resolve_engine(engine or PIPELINE_CONFIG.get('excel_engine', 'auto'))
+        digest = hashlib.sha1(f"v{self.VERSION}|{engine}|".encode('utf-8'))
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _entries(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(('.parquet', '.pkl')):
+                yield os.path.join(self.cache_dir, name)
+
+    def get(self, key: str):
+        for ext in ('.parquet', '.pkl'):
+            path = os.path.join(self.cache_dir, key + ext)
+            if not os.path.exists(path):
+                continue
+            try:
+                if ext == '.parquet':
+                    df = pd.read_parquet(path)
+                    # parquet 会把全为整数的 object 列读成数值列，恢复为写入时的类型
+                    with open(path[:-len(ext)] + '.json', 'r', encoding='utf-8') as fh:
+                        dtypes = json.load(fh)
+                    df = df.astype({col: 'object' for col, dtype in dtypes.items() if dtype == 'object'})
+                else:
+                    with open(path, 'rb') as fh:
+                        df = pickle.load(fh)
+            except Exception:
+                continue
+            os.utime(path)
+            return df
+        return None
+
+    @staticmethod
+    def parquet_safe(df: pd.DataFrame) -> bool:
+        """
+        parquet 能否原样还原 df：object 列必须全为 str。
+        混有整数和 NaN 的 object 列（如开票日期、工号）会被 parquet 读成 float，20240115 变成 20240115.0 后无法解析。
+        """
+        if not all(isinstance(col, str) for col in df.columns):
+            return False
+        for i, dtype in enumerate(df.dtypes):
+            if dtype == object and not all(isinstance(v, str) for v in df.iloc[:, i].array):
+                return False
+        return True
+
+    def put(self, key: str, df: pd.DataFrame):
+        base = os.path.join(self.cache_dir, key)
+        path = None
+        if PARQUET_AVAILABLE and self.parquet_safe(df):
+            try:
+                df.to_parquet(base + '.parquet.tmp')
+                with open(base + '.json', 'w', encoding='utf-8') as fh:
+                    json.dump({str(col): str(dtype) for col, dtype in df.dtypes.items()}, fh, ensure_ascii=False)
+                path = base + '.parquet'
+                os.replace(path + '.tmp', path)
+            except Exception:
+                path = None
+                if os.path.exists(base + '.parquet.tmp'):
+                    os.remove(base + '.parquet.tmp')
+        if path is None:
+            with open(base + '.pkl.tmp', 'wb') as fh:
+                pickle.dump(df, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(base + '.pkl.tmp', base + '.pkl')
+        self.evict()
+
+    def evict(self):
+        entries = sorted(self._entries(), key=os.path.getmtime)
+        total = sum(os.path.getsize(p) for p in entries)
+        while entries and total > self.max_bytes:
+            oldest = entries.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            meta = os.path.splitext(oldest)[0] + '.json'
+            if os.path.exists(meta):
+                os.remove(meta)
+
+
+def default_raw_cache():
+    """按 PIPELINE_CONFIG 创建原始数据缓存；关闭或缓存目录不可用时返回 None"""
+    if not PIPELINE_CONFIG.get('raw_cache'):
+        return None
+    try:
+        return RawCache(PIPELINE_CONFIG['raw_cache_dir'], float(PIPELINE_CONFIG['raw_cache_max_mb']) * 1024 * 1024)
+    except OSError:
+        return None
+
+
+def read_excel(path: str, log=print, **kwargs):
+    """按 PIPELINE_CONFIG['excel_engine'] 读取 Excel，并在日志中记录实际使用的解析引擎"""
+    engine = excel_reader.resolve_engine(PIPELINE_CONFIG.get('excel_engine', 'auto'))
+    log(f"读取 {os.path.basename(path)}（解析引擎: {engine}）")
+    return excel_reader.read_excel(path, engine=engine, **kwargs)
+
+
+def load_raw(path: str, log=print, cache: RawCache = None) -> pd.DataFrame:
+    """读取并清洗原始数据；给定 cache 时相同内容的文件直接从缓存读取"""
+    if cache is None:
+        return clean_raw(read_excel(path, log), log)
+    key = cache.key(path)
+    df = cache.get(key)
+    if df is not None:
+        log(f"原始数据未变化，使用解析缓存（{len(df)} 行）")
+        return df
+    df = clean_raw(read_excel(path, log), log)
+    try:
+        cache.put(key, df)
+    except Exception as e:
+        log(f"写入解析缓存失败（不影响处理）: {e}")
+    return df
+
+
+def load_exclusions(path: str, log=print) -> list:
+    """读取需要剔除的发票号码；未指定文件时返回空列表"""
+    if not path:
+        return []
+    df_exclude = read_excel(path, log)
+    log(f"读取到需要剔除的发票号码数量: {len(df_exclude)}")
+    exclude_invoice_numbers = [k for k in normalize_keys(df_exclude['发票号码']) if k is not None]
+    log(f"需要剔除的发票号码示例: {exclude_invoice_numbers[:5]}")
+    return exclude_invoice_numbers
+
+
+# ================== 关联键标准化 ===========================
+_DECIMAL_ZERO = re.compile(r"^(\d+)\.0+$")
+
+
+@lru_cache(maxsize=1 << 16, typed=True)
+def normalize_key(value):
+    """
+    关联键的标准形式：全角转半角（NFKC）、去首尾空白，数值与数字文本统一为不带 “.0” 的字符串，
+    使 1001、1001.0、"1001"、"１００１ " 能互相匹配；布尔值按 Excel 的显示写为 "TRUE" / "FALSE"，
+    不与 1 / 0 混同（缓存按类型区分，True 与 1 不共用缓存项）。空值返回 None。
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return None
+        return str(int(value)) if float(value).is_integer() else str(value)
+    text = unicodedata.normalize('NFKC', str(value)).strip()
+    if not text:
+        return None
+    match = _DECIMAL_ZERO.match(text)
+    return match.group(1) if match else text
+
+
+def factorize_keys(series: pd.Series):
+    """
+    整列标准化为 (下标, 标准化取值表)：每个不同取值只计算一次，空值的下标指向取值表末尾的 None。
+    factorize 把 True 与 1、1.0（False 与 0）视为同一取值，object 列中取值为 0 / 1 的行逐行重新标准化后追加到取值表。
+    """
+    codes, uniques = pd.factorize(series)
+    keys = [normalize_key(u) for u in uniques] + [None]
+    codes = np.where(codes < 0, len(uniques), codes)
+    mixed = []
+    if series.dtype == object:
+        mixed = [i for i, u in enumerate(uniques) if isinstance(u, (int, float, np.number, np.bool_)) and u in (0, 1)]
+    if mixed:
+        rows = np.flatnonzero(np.isin(codes, mixed))
+        codes[rows] = len(keys) + np.arange(len(rows))
+        keys.extend(normalize_key(v) for v in series.to_numpy(dtype=object)[rows])
+    return codes, keys
+
+
+def normalize_keys(series: pd.Series) -> pd.Series:
+    """整列标准化：每个不同取值只计算一次"""
+    codes, keys = factorize_keys(series)
+    return pd.Series(np.array(keys, dtype=object)[codes], index=series.index, dtype=object)
+
+
+def map_keys(series: pd.Series, mapping: pd.Series) -> pd.Series:
+    """按标准化后的键查 mapping（其索引应已由 _mapping 标准化）"""
+    return normalize_keys(series).map(mapping)
+
+
+def _mapping(df: pd.DataFrame, key: str, value: str) -> pd.Series:
+    """key 列（标准化后）-> value 列的映射，重复键取第一条"""
+    keys = normalize_keys(df[key])
+    mapping = pd.Series(df[value].values, index=keys.values)
+    mapping = mapping[keys.notna().values]
+    return mapping[~mapping.index.duplicated(keep='first')]
+
+
+class DimensionIndex:
+    """维度表（提单人、客户经理、集团名称、客户经理通讯录四个 Sheet）及由其生成的映射"""
+
+    def __init__(self, df_bill_person, df_account_manager, df_customer_group, df_contact_list):
+        # 分公司匹配
+        self.bill_person_name = _mapping(df_bill_person, '提单人名称', '分公司')
+        self.bill_person_id = _mapping(df_bill_person, '提单人工号', '分公司')
+        self.account_manager = _mapping(df_account_manager, '客户经理', '分公司')
+        self.customer_group = _mapping(df_customer_group, '客户名称', '分公司')
+        # 补充客户经理
+        self.manager_id = _mapping(df_account_manager, '对应工号', '客户经理')
+        self.group_name = _mapping(df_account_manager, '集团名称', '客户经理')
+        # 客户经理通讯录
+        self.director = _mapping(df_contact_list, '姓名', '总监')
+        self.director_phone = _mapping(df_contact_list, '姓名', '总监电话')
+        self.leader = _mapping(df_contact_list, '姓名', '分管领导')
+        self.leader_phone = _mapping(df_contact_list, '姓名', '分管领导电话')
+        self.manager_phone = _mapping(df_contact_list, '姓名', '联系电话')
+
+    @classmethod
+    def load(cls, path: str, log=print) -> "DimensionIndex":
+        try:
+            sheets = read_excel(path, log, sheet_name=[0, 1, 2, 3])
+        except Exception as e:
+            raise RuntimeError(f"读取维度表时出错: {e}") from e
+        for title, df in zip(["提单人维表", "客户经理维表", "集团名称维表", "客户经理通讯录"], sheets.values()):
+            log(f"{title}:")
+            log(df.head())
+        return cls(sheets[0], sheets[1], sheets[2], sheets[3])
+
+
+# ================== 处理 ===========================
+def _match(df: pd.DataFrame, target: str, source: str, mapping: pd.Series):
+    """target 仍为“未知”且 source 非空的行，按 mapping 匹配 target"""
+    mask = (df[target] == UNKNOWN) & (~df[source].isna())
+    df.loc[mask, target] = map_keys(df.loc[mask, source], mapping).fillna(UNKNOWN)
+
+
+def aging_codes(days) -> np.ndarray:
+    """回款天数 -> 催款类型在 PAYMENT_TYPES 中的下标（<=30 为 0，31~60 为 1，61~90 为 2，其余为 3）"""
+    return np.searchsorted(AGING_BOUNDS, np.asarray(days), side='left')
+
+
+def collection_type(days: pd.Series) -> pd.Series:
+    return pd.Series(np.asarray(PAYMENT_TYPES, dtype=object)[aging_codes(days)], index=days.index)
+
+
+def _base_date(as_of=None):
+    """统计基准日：未指定时为当前时间"""
+    return datetime.today() if as_of is None else pd.Timestamp(as_of).to_pydatetime()
+
+
+def aging_pivot(df: pd.DataFrame) -> pd.DataFrame:
+    return pd.pivot_table(
+        df,
+        index='所属分公司',
+        columns='催款类型',
+        values='发票总金额',
+        aggfunc='sum'
+    ).reindex(columns=PAYMENT_TYPES).fillna(0)
+
+
+def _build_notice(df_copy: pd.DataFrame, dims: DimensionIndex, category: str, days: int,
+                  with_director: bool, with_leader: bool) -> pd.DataFrame:
+    df = df_copy[df_copy['催款类型'] == category].copy()
+    if df.empty:
+        return df
+    manager = normalize_keys(df['补充客户经理'])
+    df['收票日期'] = df['开票日期'] + timedelta(days=days)
+    df['总监'] = manager.map(dims.director).fillna('') if with_director else ''
+    df['总监电话'] = manager.map(dims.director_phone).fillna('') if with_director else ''
+    df['分管领导'] = manager.map(dims.leader).fillna('') if with_leader else ''
+    df['分管领导电话'] = manager.map(dims.leader_phone).fillna('') if with_leader else ''
+    df['客户经理电话'] = manager.map(dims.manager_phone).fillna('')
+    df['短信模板'] = df.apply(
+        lambda row: MESSAGE_TEMPLATE.format(manager=row['补充客户经理'], customer=row['客户名称'],
+                                            date=row['开票日期'].strftime('%Y-%m-%d'), invoice=row['发票号码'],
+                                            amount=row['发票总金额'], days=days),
+        axis=1
+    )
+    return df[NOTICE_COLUMNS]
+
+
+def match_and_date(df_raw: pd.DataFrame, dims: DimensionIndex, exclusions=None, log=print, as_of=None):
+    """
+    剔除、匹配分公司和补充客户经理、解析开票日期，返回 (数据, 未匹配分公司数据, 未匹配客户经理数据)。
+    指定 as_of 时先过滤开票日期晚于统计日期的发票，未匹配数据中也不包含这些发票；日期无效的行不在此过滤。
+    """
+    df_copy = df_raw
+    if exclusions:
+        original_count = len(df_copy)
+        df_copy = df_copy[~normalize_keys(df_copy['发票号码']).isin(set(exclusions)).values]
+        log(f"剔除了 {original_count - len(df_copy)} 条数据")
+    dates = None
+    if as_of is not None:
+        base_date = _base_date(as_of)
+        dates = pd.to_datetime(df_copy['开票日期'], format='%Y%m%d', errors='coerce')
+        future = (dates > base_date).values
+        if future.any():
+            log(f"注意：有{int(future.sum())}条数据的开票日期晚于统计日期 {base_date:%Y-%m-%d}，已过滤")
+            df_copy, dates = df_copy[~future], dates[~future]
+    df_copy = df_copy.copy()
+
+    # 分公司：依次按提单人名称、提单人工号、客户经理名称、客户名称匹配
+    df_copy['所属分公司'] = UNKNOWN
+    log("开始按提单人名称匹配分公司...")
+    _match(df_copy, '所属分公司', '提单人名称', dims.bill_person_name)
+    log("开始按提单人工号匹配分公司...")
+    _match(df_copy, '所属分公司', '提单人工号', dims.bill_person_id)
+    log("开始按客户经理名称匹配分公司...")
+    _match(df_copy, '所属分公司', '客户经理名称', dims.account_manager)
+    log("开始按客户名称匹配分公司...")
+    _match(df_copy, '所属分公司', '客户名称', dims.customer_group)
+
+    log("分公司匹配结果统计:")
+    log(df_copy['所属分公司'].value_counts())
+    unknown_branch = df_copy[df_copy['所属分公司'] == UNKNOWN]
+    log(f"未知分公司的数据条数: {len(unknown_branch)}")
+
+    # 补充客户经理：优先取原有客户经理名称，否则按客户名称匹配集团名称
+    log("\n开始补充客户经理匹配...")
+    df_copy['补充客户经理'] = UNKNOWN
+    log("第一步：复制原有客户经理名称...")
+    existing_manager_mask = ~df_copy['客户经理名称'].isna()
+    df_copy.loc[existing_manager_mask, '补充客户经理'] = df_copy.loc[existing_manager_mask, '客户经理名称']
+    log("第三步：通过客户名称匹配客户经理...")
+    _match(df_copy, '补充客户经理', '客户名称', dims.group_name)
+
+    log("补充客户经理匹配结果统计:")
+    log(df_copy['补充客户经理'].value_counts())
+    unknown_manager = df_copy[df_copy['补充客户经理'] == UNKNOWN]
+    log(f"未知客户经理的数据条数: {len(unknown_manager)}")
+
+    # 日期处理和回款天数
+    df_copy['开票日期'] = dates if dates is not None else \
+        pd.to_datetime(df_copy['开票日期'], format='%Y%m%d', errors='coerce')
+    invalid_date_count = df_copy['开票日期'].isna().sum()
+    if invalid_date_count > 0:
+        log(f"注意：有{invalid_date_count}条数据的开票日期格式无效，已过滤")
+        df_copy = df_copy.dropna(subset=['开票日期'])
+    return df_copy, unknown_branch, unknown_manager
+
+
+def transform(df_raw: pd.DataFrame, dims: DimensionIndex, exclusions=None, log=print, as_of=None) -> dict:
+    """
+    对清洗后的原始数据做剔除、匹配和账龄计算，返回 {Sheet 名: DataFrame}（按写出顺序）。
+    as_of 为统计基准日（默认当前时间）；指定时开票日期晚于基准日的发票不参与统计。
+    """
+    df_copy, unknown_branch, unknown_manager = match_and_date(df_raw, dims, exclusions, log, as_of)
+    base_date = _base_date(as_of)
+    df_copy['回款天数'] = (base_date - df_copy['开票日期']).dt.days
+    df_copy['催款类型'] = collection_type(df_copy['回款天数'])
+
+    pivot_table = aging_pivot(df_copy)
+    log(pivot_table)
+
+    results = {
+        '处理后的数据': df_copy,
+        '数据汇总': pivot_table,
+        '未匹配分公司数据': unknown_branch,
+        '未匹配客户经理数据': unknown_manager,
+    }
+    for sheet_name, category, days, with_director, with_leader in NOTICE_SHEETS:
+        results[sheet_name] = _build_notice(df_copy, dims, category, days, with_director, with_leader)
+    return results
+
+
+def run_transform(df_raw: pd.DataFrame, dims: DimensionIndex, exclusions=None, log=print, as_of=None,
+                  engine: str = None) -> dict:
+    """按 engine（默认 PIPELINE_CONFIG['engine']）选择处理引擎执行 transform"""
+    engine = engine or PIPELINE_CONFIG.get('engine', 'pandas')
+    if engine == "polars":
+        import excel_polars
+        if excel_polars.POLARS_AVAILABLE:
+            log("处理引擎: polars")
+            return excel_polars.transform(df_raw, dims, exclusions, log, as_of=as_of)
+        log("未安装 polars（pip install polars），使用 pandas 引擎")
+    return transform(df_raw, dims, exclusions, log, as_of=as_of)
+
+
+def backfill_aging(df: pd.DataFrame, as_of_dates, max_cells: int = 2_000_000) -> pd.DataFrame:
+    """
+    一次计算多个统计日期的账龄汇总（与逐日运行 transform 的数据汇总一致）：
+    统计日期 x 发票的回款天数矩阵按块广播计算，按 (日期, 分公司, 催款类型) 用 bincount 汇总金额。
+    df 为 match_and_date 的结果；返回以 (统计日期, 所属分公司) 为索引、PAYMENT_TYPES 为列的 DataFrame，
+    只包含当日已开票的分公司。max_cells 限制每块矩阵的元素数以控制内存（天数用 int32、催款类型用 int8，
+    每个元素连同取出的下标和金额不超过约 30 字节，默认每块约 60MB）。
+    """
+    dates = pd.DatetimeIndex(pd.to_datetime(list(as_of_dates))).sort_values()
+    branch_codes, branches = pd.factorize(df['所属分公司'], sort=True)
+    branch_codes = branch_codes.astype('int32')
+    amount = df['发票总金额'].to_numpy(dtype='float64')
+    invoice_day = df['开票日期'].to_numpy(dtype='datetime64[D]').astype('int32')
+    date_day = dates.to_numpy(dtype='datetime64[D]').astype('int32')
+    n_branch, n_type = len(branches), len(PAYMENT_TYPES)
+
+    totals = np.zeros((len(dates), n_branch, n_type))
+    present = np.zeros((len(dates), n_branch), dtype=bool)
+    step = max(1, max_cells // max(1, len(df)))
+    for start in range(0, len(dates), step):
+        block = date_day[start:start + step]
+        days = block[:, None] - invoice_day[None, :]
+        issued = days >= 0
+        # 与 aging_codes 相同：超过几个天数上界即为第几类
+        codes = np.zeros(days.shape, dtype=np.int8)
+        for bound in AGING_BOUNDS:
+            codes += days > bound
+        del days
+        # 已开票元素的 (日期块内序号, 分公司) 下标，再展开为 (日期块内序号, 分公司, 催款类型)
+        cells = (np.arange(len(block), dtype=np.int32)[:, None] * n_branch + branch_codes[None, :])[issued]
+        size = len(block) * n_branch * n_type
+        totals[start:start + len(block)] = np.bincount(
+            cells * n_type + codes[issued], weights=np.broadcast_to(amount, issued.shape)[issued], minlength=size
+        ).reshape(len(block), n_branch, n_type)
+        present[start:start + len(block)] = np.bincount(
+            cells, minlength=len(block) * n_branch
+        ).reshape(len(block), n_branch) > 0
+
+    index = pd.MultiIndex.from_product([dates, branches], names=['统计日期', '所属分公司'])
+    result = pd.DataFrame(totals.reshape(-1, n_type), index=index, columns=PAYMENT_TYPES)
+    result.columns.name = '催款类型'
+    return result[present.reshape(-1)]
+
+
+def run_backfill(raw_path: str, dim_path: str, exclude_path: str, save_dir: str, start, end,
+                 freq: str = 'D', log=print) -> str:
+    """读取并匹配一次原始数据，计算 start~end 每个统计日期的账龄汇总并写出 Excel，返回文件路径"""
+    df_raw, dims, exclusions = load_inputs(raw_path, dim_path, exclude_path, log)
+    df, _, _ = match_and_date(df_raw, dims, exclusions, log)
+    dates = pd.date_range(start, end, freq=freq)
+    log(f"计算 {len(dates)} 个统计日期的账龄汇总...")
+    trend = backfill_aging(df, dates)
+    result_filepath = os.path.join(save_dir, f"{TREND_PREFIX}{dates[0]:%Y%m%d}_{dates[-1]:%Y%m%d}.xlsx")
+    with pd.ExcelWriter(result_filepath, engine='openpyxl') as writer:
+        trend.reset_index().to_excel(writer, sheet_name='账龄趋势', index=False)
+        trend.groupby(level='统计日期').sum().to_excel(writer, sheet_name='全公司汇总', index=True)
+    log("处理完成！")
+    return result_filepath
+
+
+# ================== 写出 ===========================
+# xlsx 单个 Sheet 的行数、列数上限
+EXCEL_MAX_ROWS = 1_048_576
+EXCEL_MAX_COLS = 16_384
+# 逐块把 DataFrame 转为 Python 值后流式写入，每块行数
+WRITE_CHUNK_ROWS = 100_000
+# 日期列的单元格格式（与 pandas to_excel 相同）
+DATETIME_FORMAT = 'YYYY-MM-DD HH:MM:SS'
+# 带索引写出的 Sheet（其余 Sheet 为空时不写）
+INDEXED_SHEETS = {'数据汇总'}
+ALWAYS_WRITTEN = {'处理后的数据', '数据汇总'}
+
+
+def sheet_layout(results: dict) -> list:
+    """
+    写出前的 Sheet 规划：[(Sheet 名, 结果名, 起始行, 结束行, 是否写索引)]。
+    超过单 Sheet 行数上限的结果按顺序拆为 “名称_1”、“名称_2” ……；列数超限时抛出 ValueError。
+    """
+    layout = []
+    for name, df in results.items():
+        index = name in INDEXED_SHEETS
+        if df.empty and name not in ALWAYS_WRITTEN:
+            continue
+        n_cols = len(df.columns) + (1 if index else 0)
+        if n_cols > EXCEL_MAX_COLS:
+            raise ValueError(f"{name} 共 {n_cols} 列，超过 Excel 单个 Sheet 的 {EXCEL_MAX_COLS} 列上限")
+        # 表头占一行（带索引时索引名写在表头第一列）
+        capacity = EXCEL_MAX_ROWS - 1
+        if len(df) <= capacity:
+            layout.append((name, name, 0, len(df), index))
+            continue
+        for part, start in enumerate(range(0, len(df), capacity), 1):
+            layout.append((f"{name}_{part}", name, start, min(start + capacity, len(df)), index))
+    return layout
+
+
+def _sheet_rows(ws, df: pd.DataFrame, start: int, stop: int, index: bool):
+    """
+    df 第 start~stop 行的写出内容：表头一行，其后每块 WRITE_CHUNK_ROWS 行转为 Python 值逐行产出，
+    空值写为空单元格，日期列使用 DATETIME_FORMAT。
+    """
+    yield ([df.index.name] if index else []) + list(df.columns)
+    for offset in range(start, stop, WRITE_CHUNK_ROWS):
+        chunk = df.iloc[offset:min(offset + WRITE_CHUNK_ROWS, stop)]
+        if index:
+            chunk = chunk.reset_index()
+        date_cols = [i for i, dtype in enumerate(chunk.dtypes) if pd.api.types.is_datetime64_any_dtype(dtype)]
+        values = chunk.astype(object).where(chunk.notna().values, None)
+        for row in values.itertuples(index=False, name=None):
+            row = list(row)
+            for i in date_cols:
+                if row[i] is not None:
+                    row[i] = WriteOnlyCell(ws, value=row[i].to_pydatetime())
+                    row[i].number_format = DATETIME_FORMAT
+            yield row
+
+
+def write_results(results: dict, save_dir: str, tag: str = None, log=print) -> str:
+    """
+    写出结果 Excel，返回文件路径；数据汇总带索引，其余 Sheet 为空时不写。
+    先按 sheet_layout 检查并规划拆分，再用 openpyxl 的 write_only 工作簿逐行写入，单元格不在内存中累积。
+    """
+    layout = sheet_layout(results)
+    for sheet_name, name, start, stop, _ in layout:
+        if sheet_name != name:
+            log(f"{name} 超过 Excel 行数上限，第 {start + 1}~{stop} 行写入 Sheet “{sheet_name}”")
+    current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
+    result_filename = f"{RESULT_PREFIX}{tag + '_' if tag else ''}{current_time}.xlsx"
+    result_filepath = os.path.join(save_dir, result_filename)
+    wb = Workbook(write_only=True)
+    for sheet_name, name, start, stop, index in layout:
+        ws = wb.create_sheet(sheet_name)
+        for row in _sheet_rows(ws, results[name], start, stop, index):
+            ws.append(row)
+    wb.save(result_filepath)
+    return result_filepath
+
+
+SOURCE_TITLES = {"raw": "原始数据文件", "dims": "维度表文件", "exclude": "剔除工单号文件"}
+
+
+def _load_source(kind: str, path: str, config: dict):
+    """在线程或子进程中读取一个输入源，返回 (结果, 日志)；日志由调用方按输入源成组输出"""
+    PIPELINE_CONFIG.update(config)
+    lines = []
+    if kind == "raw":
+        value = load_raw(path, lines.append, cache=default_raw_cache())
+    elif kind == "dims":
+        value = DimensionIndex.load(path, lines.append)
+    else:
+        value = load_exclusions(path, lines.append)
+    return value, lines
+
+
+def load_inputs(raw_path: str, dim_path: str, exclude_path: str, log=print, dims: DimensionIndex = None,
+                exclusions=None, mode: str = None):
+    """
+    同时读取原始数据、维度表和剔除名单（维度表的映射在原始数据清洗期间建好），返回 (原始数据, 维度表, 剔除名单)。
+    mode 为 process / thread / off，默认取 PIPELINE_CONFIG['parallel_load']；已给出的 dims / exclusions 不再读取。
+    原始数据或维度表读取失败时，汇总各输入源的错误后抛出 RuntimeError；剔除名单读取失败只记录日志。
+    """
+    sources = {"raw": raw_path}
+    if dims is None:
+        sources["dims"] = dim_path
+    if exclusions is None and exclude_path:
+        sources["exclude"] = exclude_path
+    mode = mode or PIPELINE_CONFIG.get('parallel_load', 'process')
+    if mode == "process" and (os.cpu_count() or 1) < 2:
+        mode = "thread"
+    config = dict(PIPELINE_CONFIG)
+    loaded, errors = {}, {}
+    start = time.perf_counter()
+
+    def collect(kind, load):
+        try:
+            value, lines = load()
+        except Exception as e:
+            errors[kind] = e
+            return
+        for line in lines:
+            log(line)
+        loaded[kind] = value
+
+    if mode == "off" or len(sources) == 1:
+        for kind, path in sources.items():
+            collect(kind, lambda: _load_source(kind, path, config))
+    else:
+        executor = ProcessPoolExecutor if mode == "process" else ThreadPoolExecutor
+        with executor(max_workers=len(sources)) as pool:
+            futures = {pool.submit(_load_source, kind, path, config): kind for kind, path in sources.items()}
+            for fut in as_completed(futures):
+                collect(futures[fut], fut.result)
+    log(f"输入读取完成，用时 {time.perf_counter() - start:.1f} 秒")
+
+    if "exclude" in errors:
+        log(f"读取剔除工单号文件时出错: {errors.pop('exclude')}")
+    if errors:
+        raise RuntimeError("；".join(f"{SOURCE_TITLES[kind]}读取失败: {e}" for kind, e in errors.items()))
+    return loaded["raw"], loaded.get("dims", dims), loaded.get("exclude", exclusions)
+
+
+def run_pipeline(raw_path: str, dim_path: str, exclude_path: str, save_dir: str, log=print,
+                 dims: DimensionIndex = None, exclusions=None, tag: str = None, as_of=None,
+                 parallel_load: str = None, engine: str = None) -> str:
+    """
+    完整处理一个原始数据文件，返回结果文件路径。
+    dims / exclusions 已加载时（如监控模式）直接复用，不再重复读取；as_of 为统计基准日（默认今天）；
+    parallel_load 见 load_inputs；engine 见 run_transform。
+    """
+    log("开始处理数据...")
+    log(f"原始数据文件: {raw_path}")
+    log(f"维度表文件: {dim_path}")
+    log(f"剔除工单号文件: {exclude_path}")
+    log(f"保存文件夹: {save_dir}")
+    if as_of is not None:
+        log(f"统计日期: {pd.Timestamp(as_of):%Y-%m-%d}")
+
+    df_raw, dims, exclusions = load_inputs(raw_path, dim_path, exclude_path, log, dims, exclusions,
+                                           mode=parallel_load)
+    if len(df_raw) >= EXCEL_MAX_ROWS:
+        log(f"原始数据清洗后 {len(df_raw)} 行，超过 Excel 单个 Sheet 上限的结果将自动拆分为多个 Sheet")
+    results = run_transform(df_raw, dims, exclusions, log, as_of=as_of, engine=engine)
+    result_filepath = write_results(results, save_dir, tag, log)
+    log("处理完成！")
+    return result_filepath
+
+
+# ================== 并行任务 ===========================
+def job_name(raw_path: str) -> str:
+    return os.path.splitext(os.path.basename(raw_path))[0]
+
+
+def make_jobs(raw_paths, dim_path: str, exclude_path: str, save_dir: str, as_of=None, engine: str = None) -> list:
+    """每个原始数据文件一个任务；任务名取文件名（重名时加序号），同时用作结果文件名标记和日志文件名"""
+    jobs, names = [], set()
+    for raw_path in raw_paths:
+        name = base = job_name(raw_path)
+        k = 1
+        while name in names:
+            k += 1
+            name = f"{base}_{k}"
+        names.add(name)
+        jobs.append({"name": name, "raw": raw_path, "dims": dim_path, "exclude": exclude_path,
+                     "output": save_dir, "as_of": as_of, "engine": engine,
+                     "log_path": os.path.join(save_dir, f"{name}.log")})
+    return jobs
+
+
+def run_job(job: dict, queue=None) -> str:
+    """
+    进程池中的单个任务：日志只写到本任务自己的日志文件，给定 queue 时同时以 (任务名, 文本) 发回主进程，
+    不触碰进程级的 sys.stdout。返回结果文件路径。
+    """
+    with open(job['log_path'], 'w', encoding='utf-8') as fh:
+        def log(msg):
+            text = str(msg)
+            fh.write(text + "\n")
+            fh.flush()
+            if queue is not None:
+                queue.put((job['name'], text))
+        try:
+            # 已在进程池中按文件并行，输入读取改用线程，避免进程数成倍增加
+            return run_pipeline(job['raw'], job['dims'], job['exclude'], job['output'], log=log,
+                                tag=job['name'], as_of=job.get('as_of'), parallel_load="thread",
+                                engine=job.get('engine'))
+        except Exception as e:
+            log(f"处理过程中出错: {e}")
+            raise
+
+
+def run_jobs(jobs: list, max_workers: int = None, queue=None, log=print) -> dict:
+    """在进程池中并行运行多个任务，返回 {任务名: 结果文件路径或异常}"""
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run_job, job, queue): job['name'] for job in jobs}
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                results[name] = fut.result()
+                log(f"[{name}] 完成: {results[name]}")
+            except Exception as e:
+                results[name] = e
+                log(f"[{name}] 失败: {e}")
+    return results
+
+
+# ================== 监控目录 ===========================
+class _Resident:
+    """常驻内存的参考数据：源文件（大小、修改时间）不变时直接复用已解析的结果"""
+
+    def __init__(self, path: str, loader):
+        self.path = path
+        self.loader = loader
+        self.signature = None
+        self.value = None
+
+    def get(self, log=print):
+        if not self.path:
+            return None
+        stat = os.stat(self.path)
+        signature = (stat.st_size, stat.st_mtime)
+        if signature != self.signature:
+            log(f"加载参考数据: {self.path}")
+            self.value = self.loader(self.path, log)
+            self.signature = signature
+        return self.value
+
+
+def _is_extract(name: str) -> bool:
+    # 跳过 Excel 打开文件时生成的 ~$ 临时文件，以及本程序写出的结果文件
+    return name.lower().endswith(('.xlsx', '.xls')) and not name.startswith(('~$', RESULT_PREFIX, TREND_PREFIX))
+
+
+def _unreadable_reason(path: str) -> str:
+    """
+    大小稳定后再确认文件可以处理：只读打开（只读文件、只读共享同样可以处理），
+    xlsx 需有完整的 zip 目录（复制中断或仍在写入时缺失）。可以处理时返回空串，否则返回原因。
+    """
+    try:
+        with open(path, 'rb') as fh:
+            if path.lower().endswith('.xlsx') and not zipfile.is_zipfile(fh):
+                return "xlsx 文件不完整（可能仍在复制）"
+    except OSError as e:
+        return f"无法读取: {e}"
+    return ""
+
+
+def watch_folder(input_dir: str, dim_path: str, exclude_path: str, output_dir: str, interval: float = 5.0,
+                 stable_polls: int = 2, log=print, once: bool = False):
+    """
+    监控 input_dir，新的原始数据文件写入完成（连续 stable_polls 次轮询大小和修改时间不变且内容完整）后自动处理，
+    结果写到 output_dir。维度表和剔除名单常驻内存，文件变化时才重新读取。
+    已处理的文件记录在 output_dir/已处理文件.json，文件内容变化后会重新处理。once=True 时只扫描一轮。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, "已处理文件.json")
+    processed = {}
+    if os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as fh:
+            processed = json.load(fh)
+    dims = _Resident(dim_path, DimensionIndex.load)
+    exclusions = _Resident(exclude_path, load_exclusions)
+    seen = {}
+    skipped = {}
+    log(f"开始监控目录: {input_dir}（每 {interval} 秒扫描一次）")
+
+    while True:
+        for name in sorted(os.listdir(input_dir)):
+            path = os.path.join(input_dir, name)
+            if not _is_extract(name) or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            signature = [stat.st_size, stat.st_mtime]
+            if processed.get(name, {}).get('signature') == signature:
+                continue
+            prev, polls = seen.get(name, (None, 0))
+            polls = polls + 1 if prev == signature else 1
+            seen[name] = (signature, polls)
+            if polls < stable_polls:
+                continue
+            reason = _unreadable_reason(path)
+            if reason:
+                # 同一版本的文件只记录一次，之后继续轮询重试
+                if skipped.get(name) != signature:
+                    log(f"暂不处理 {name}: {reason}")
+                    skipped[name] = signature
+                continue
+            skipped.pop(name, None)
+
+            record = {"signature": signature, "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+            try:
+                try:
+                    excluded = exclusions.get(log)
+                except Exception as e:
+                    log(f"读取剔除工单号文件时出错: {e}")
+                    excluded = None
+                record['result'] = run_pipeline(path, dim_path, exclude_path, output_dir, log=log,
+                                                dims=dims.get(log), exclusions=excluded or [],
+                                                tag=os.path.splitext(name)[0])
+                log(f"已处理: {name} -> {record['result']}")
+            except Exception as e:
+                record['error'] = str(e)
+                log(f"处理 {name} 时出错: {e}")
+            processed[name] = record
+            seen.pop(name, None)
+            with open(state_path, 'w', encoding='utf-8') as fh:
+                json.dump(processed, fh, ensure_ascii=False, indent=2)
+        if once:
+            return processed
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据催款处理")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="处理一个或多个原始数据文件")
+    run.add_argument("--raw", required=True, nargs="+", help="原始数据文件（多个时并行处理）")
+    run.add_argument("--jobs", type=int, default=None, help="并行进程数（默认 CPU 核数）")
+    run.add_argument("--as-of", default=None, help="统计日期（默认今天），如 2024-06-30")
+    run.add_argument("--engine", default=None, choices=["pandas", "polars"], help="处理引擎（默认取配置）")
+    backfill = sub.add_parser("backfill", help="计算一段日期内每个统计日期的账龄汇总")
+    backfill.add_argument("--raw", required=True, help="原始数据文件")
+    backfill.add_argument("--start", required=True, help="起始统计日期")
+    backfill.add_argument("--end", required=True, help="结束统计日期")
+    backfill.add_argument("--freq", default="D", help="日期间隔（pandas 频率，如 D / W / M）")
+    watch = sub.add_parser("watch", help="监控目录，自动处理新的原始数据文件")
+    watch.add_argument("--input", required=True, help="原始数据文件所在目录")
+    watch.add_argument("--interval", type=float, default=5.0, help="扫描间隔（秒）")
+    watch.add_argument("--stable-polls", type=int, default=2, help="文件大小连续多少次不变视为写入完成")
+    for p in (run, backfill, watch):
+        p.add_argument("--dims", required=True, help="维度表文件")
+        p.add_argument("--exclude", default="", help="剔除工单号文件（可选）")
+        p.add_argument("--output", required=True, help="保存文件夹")
+    args = parser.parse_args()
+
+    if args.command == "run" and len(args.raw) > 1:
+        results = run_jobs(make_jobs(args.raw, args.dims, args.exclude, args.output, args.as_of,
+                                         args.engine), args.jobs)
+        if any(isinstance(r, Exception) for r in results.values()):
+            raise SystemExit(1)
+    elif args.command == "run":
+        path = run_pipeline(args.raw[0], args.dims, args.exclude, args.output, as_of=args.as_of,
+                            engine=args.engine)
+        print(f"文件已成功保存至: {path}")
+    elif args.command == "backfill":
+        path = run_backfill(args.raw, args.dims, args.exclude, args.output, args.start, args.end, args.freq)
+        print(f"文件已成功保存至: {path}")
+    else:
+        watch_folder(args.input, args.dims, args.exclude, args.output, interval=args.interval,
+                     stable_polls=args.stable_polls)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+催款数据处理的 polars 引擎：与 excel_pipeline.transform 相同的剔除、分公司 / 客户经理级联匹配、回款天数与催款类型、
+通报短信模板和数据汇总，写成 polars 惰性查询，由流式引擎多线程分批执行。
+PIPELINE_CONFIG['engine'] = "polars" 时 excel_pipeline 使用本引擎。
+
+原始数据各列仍保留在 pandas 中，polars 只处理参与计算的列（标准化后的关联键、开票日期、金额和模板用文本），
+维度映射的取值只以下标参与计算；查询结束后按行号取回原始行、按下标取回映射值，
+因此混合类型的列（如数字与文本混排的工号）也与 pandas 引擎的输出完全一致。
+参与计算的列按不同取值转换后在 polars 中按下标展开，不为每行创建 Python 对象。
+原始数据和结果仍完整保存在内存中（Excel 解析和混合类型列都需要 pandas），本引擎不是外存计算。
+
+一致性检查：python excel_polars.py --raw 原始数据.xlsx --dims 维度表.xlsx [--exclude 剔除.xlsx] [--as-of 2024-06-30]
+"""
+import argparse
+import string
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import excel_pipeline
+from excel_pipeline import (AGING_BOUNDS, MESSAGE_TEMPLATE, NOTICE_COLUMNS, NOTICE_SHEETS, PAYMENT_TYPES, UNKNOWN,
+                            aging_pivot, factorize_keys, normalize_key, _base_date)
+
+# =============== 可选依赖：polars ==================
+try:
+    import polars as pl
+    POLARS_AVAILABLE = True
+except Exception:
+    pl = None
+    POLARS_AVAILABLE = False
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+# 关联键列：polars 中的列名 -> 原始数据列名
+KEY_COLUMNS = {
+    "invoice_key": '发票号码',
+    "bill_name_key": '提单人名称',
+    "bill_id_key": '提单人工号',
+    "manager_key": '客户经理名称',
+    "customer_key": '客户名称',
+}
+# 短信模板用文本（与 str.format 的结果相同）：polars 中的列名 -> 原始数据列名
+TEXT_COLUMNS = {
+    "manager_text": '客户经理名称',
+    "customer_text": '客户名称',
+    "invoice_text": '发票号码',
+    "amount_text": '发票总金额',
+}
+# 通报中的联系人：通报列名 -> DimensionIndex 属性
+CONTACTS = {'总监': 'director', '总监电话': 'director_phone', '分管领导': 'leader',
+            '分管领导电话': 'leader_phone', '客户经理电话': 'manager_phone'}
+
+
+def _strings(values) -> "pl.Series":
+    """标准化后的键（字符串或 None）转为 polars 字符串列"""
+    arr = np.asarray(values, dtype=object)
+    return pl.Series([None if v is None else str(v) for v in arr], dtype=pl.String)
+
+
+def _gather(values: list, codes: np.ndarray) -> "pl.Series":
+    """按 codes 从不同取值表 values 中取值，在 polars 中整列展开"""
+    return pl.Series(values, dtype=pl.String).gather(pl.Series(codes, dtype=pl.Int64))
+
+
+def _keys(series: pd.Series) -> "pl.Series":
+    """与 normalize_keys 相同的标准化关联键（空值为 null），每个不同取值只计算一次"""
+    codes, keys = factorize_keys(series)
+    return _gather([None if k is None else str(k) for k in keys], codes)
+
+
+def _texts(series: pd.Series) -> "pl.Series":
+    """整列按 str() 转为文本，每个不同取值只转换一次；空值按各自的值转换（'nan' / 'None'），与逐行 format 一致"""
+    codes, uniques = pd.factorize(series)
+    texts = [str(u) for u in uniques]
+    missing = np.flatnonzero(codes < 0)
+    if len(missing):
+        index = {}
+        for pos, value in zip(missing, series.iloc[missing].tolist()):
+            codes[pos] = index.setdefault(str(value), len(texts) + len(index))
+        texts.extend(index)
+    return _gather(texts, codes)
+
+
+class _Values:
+    """维度映射取值表：各映射的值依次放入同一个数组，polars 中只传递下标（code）"""
+
+    UNKNOWN_CODE = 0
+    EMPTY_CODE = 1
+
+    def __init__(self):
+        self.values = [UNKNOWN, '']
+
+    def lookup(self, mapping: pd.Series, key: str, code: str, skip_unknown: bool = False) -> "pl.LazyFrame":
+        """
+        mapping（索引为标准化后的键）-> polars 查找表 (key, code)。
+        值为空的键不放入（skip_unknown 时值为“未知”的也不放入），查不到时由调用方补默认值，与 pandas 引擎的 fillna 相同。
+        """
+        values = np.asarray(mapping.values, dtype=object)
+        valid = pd.notna(values)
+        if skip_unknown:
+            valid &= values != UNKNOWN
+        offset = len(self.values)
+        self.values.extend(values[valid])
+        return pl.LazyFrame({
+            key: _strings(mapping.index[valid]),
+            code: pl.Series(np.arange(offset, offset + int(valid.sum()), dtype=np.int64)),
+        })
+
+    def table(self, code: str, key: str, text: str) -> "pl.LazyFrame":
+        """下标 -> (标准化键, 文本)，用于以映射值为键的下一级匹配和短信模板"""
+        return pl.LazyFrame({
+            code: pl.Series(np.arange(len(self.values), dtype=np.int64)),
+            key: _strings([normalize_key(v) for v in self.values]),
+            text: pl.Series([str(v) for v in self.values], dtype=pl.String),
+        })
+
+    def resolve(self, codes) -> np.ndarray:
+        return np.asarray(self.values, dtype=object)[np.asarray(codes, dtype=np.int64)]
+
+
+def _join(lf, lookup, on: str):
+    return lf.join(lookup, on=on, how='left', maintain_order='left')
+
+
+def _template(days: int):
+    """MESSAGE_TEMPLATE 对应的 pl.format 表达式"""
+    fields = {
+        'manager': pl.col('supplement_text'),
+        'customer': pl.col('customer_text'),
+        'date': pl.col('date').dt.strftime('%Y-%m-%d'),
+        'invoice': pl.col('invoice_text'),
+        'amount': pl.col('amount_text'),
+    }
+    parts, args = [], []
+    for literal, field, _, _ in string.Formatter().parse(MESSAGE_TEMPLATE):
+        parts.append(literal)
+        if field == 'days':
+            parts.append(str(days))
+        elif field is not None:
+            parts.append('{}')
+            args.append(fields[field])
+    return pl.format(''.join(parts), *args)
+
+
+def transform(df_raw: pd.DataFrame, dims, exclusions=None, log=print, as_of=None) -> dict:
+    """与 excel_pipeline.transform 相同的输入和输出：{Sheet 名: DataFrame}"""
+    if not POLARS_AVAILABLE:
+        raise RuntimeError("未安装 polars（pip install polars），无法使用 polars 引擎")
+    start = time.perf_counter()
+    dates = pd.to_datetime(df_raw['开票日期'], format='%Y%m%d', errors='coerce')
+    manager = df_raw['客户经理名称']
+    data = {"row": pl.Series(np.arange(len(df_raw), dtype=np.int64))}
+    for name, column in KEY_COLUMNS.items():
+        data[name] = _keys(df_raw[column])
+    for name, column in TEXT_COLUMNS.items():
+        data[name] = _texts(df_raw[column])
+    # 原有客户经理名称非空时直接沿用；为“未知”时与空值一样继续按客户名称匹配
+    data["has_manager"] = pl.Series((manager.notna() & (manager != UNKNOWN)).to_numpy(dtype=bool))
+    data["date"] = pl.Series(dates.to_numpy(dtype='datetime64[ns]'))
+    data["amount"] = pl.Series(df_raw['发票总金额'].to_numpy(dtype='float64'))
+    lf = pl.DataFrame(data).lazy()
+
+    if exclusions:
+        lf = lf.filter(~pl.col('invoice_key').is_in([str(k) for k in exclusions]).fill_null(False))
+    excluded = lf
+    # 开票日期晚于统计日期的发票在匹配前过滤（与 pandas 引擎一样，未匹配数据中也不包含；日期无效的行保留）
+    base_date = _base_date(as_of)
+    if as_of is not None:
+        lf = lf.filter(pl.col('date').is_null() | (pl.col('date') <= base_date))
+
+    # 分公司：依次按提单人名称、提单人工号、客户经理名称、客户名称匹配，取第一个匹配到的
+    values = _Values()
+    branch_steps = [('bill_name_key', dims.bill_person_name), ('bill_id_key', dims.bill_person_id),
+                    ('manager_key', dims.account_manager), ('customer_key', dims.customer_group)]
+    for k, (key, mapping) in enumerate(branch_steps):
+        lf = _join(lf, values.lookup(mapping, key, f"branch_{k}", skip_unknown=True), key)
+    lf = lf.with_columns(branch=pl.coalesce([f"branch_{k}" for k in range(len(branch_steps))]
+                                            + [pl.lit(_Values.UNKNOWN_CODE, dtype=pl.Int64)]))
+
+    # 补充客户经理：原有客户经理名称，否则按客户名称匹配集团名称
+    lf = _join(lf, values.lookup(dims.group_name, 'customer_key', 'group', skip_unknown=True), 'customer_key')
+    lf = lf.with_columns(group=pl.col('group').fill_null(_Values.UNKNOWN_CODE))
+    contact_lookups = {name: values.lookup(getattr(dims, attr), 'supplement_key', name)
+                       for name, attr in CONTACTS.items()}
+    lf = _join(lf, values.table('group', 'group_key', 'group_text'), 'group')
+    lf = lf.with_columns(
+        supplement_key=pl.when('has_manager').then('manager_key').otherwise('group_key'),
+        supplement_text=pl.when('has_manager').then('manager_text').otherwise('group_text'),
+    )
+    matched = lf
+    unknown_branch = matched.filter(pl.col('branch') == _Values.UNKNOWN_CODE).select('row')
+    unknown_manager = matched.filter(~pl.col('has_manager') & (pl.col('group') == _Values.UNKNOWN_CODE)
+                                     ).select('row', 'branch')
+
+    # 回款天数与催款类型（与 pandas 的 Timedelta.days 一样向下取整）
+    dated = matched.filter(pl.col('date').is_not_null())
+    dated = dated.with_columns(
+        days=(pl.lit(base_date) - pl.col('date')).dt.total_nanoseconds() // NS_PER_DAY)
+    dated = dated.with_columns(aging=pl.sum_horizontal([(pl.col('days') > b).cast(pl.Int64) for b in AGING_BOUNDS]))
+
+    processed = dated.select('row', 'branch', 'has_manager', 'group', 'days', 'aging')
+    summary = dated.group_by('branch', 'aging').agg(pl.col('amount').sum())
+    counts = excluded.select(total=pl.len(), invalid_date=pl.col('date').is_null().sum(),
+                             future=(pl.col('date') > base_date).sum() if as_of is not None else pl.lit(0))
+    queries = [excluded.select(pl.len()), counts, unknown_branch, unknown_manager, processed, summary]
+    for _, category, days, _, _ in NOTICE_SHEETS:
+        notice = dated.filter(pl.col('aging') == PAYMENT_TYPES.index(category))
+        for name, lookup in contact_lookups.items():
+            notice = _join(notice, lookup, 'supplement_key')
+        queries.append(notice.select(
+            'row', *[pl.col(name).fill_null(_Values.EMPTY_CODE) for name in CONTACTS], message=_template(days)))
+    frames = pl.collect_all(queries, engine='streaming')
+    log(f"polars 查询完成，用时 {time.perf_counter() - start:.1f} 秒")
+    return _assemble(df_raw, dates, values, exclusions, frames, log)
+
+
+def _assemble(df_raw: pd.DataFrame, dates: pd.Series, values: _Values, exclusions, frames, log) -> dict:
+    """按行号取回原始行、按下标取回映射值，组装成与 pandas 引擎相同的结果"""
+    kept, counts, unknown_branch, unknown_manager, processed, summary = frames[:6]
+    notices = frames[6:]
+    counts = counts.row(0, named=True)
+    if exclusions:
+        log(f"剔除了 {len(df_raw) - kept.item()} 条数据")
+    if counts['future'] > 0:
+        log(f"注意：有{counts['future']}条数据的开票日期晚于统计日期，已过滤")
+
+    branch_rows = unknown_branch['row'].to_numpy()
+    df_unknown_branch = df_raw.iloc[branch_rows].copy()
+    df_unknown_branch['所属分公司'] = UNKNOWN
+    log(f"未知分公司的数据条数: {len(df_unknown_branch)}")
+
+    manager_rows = unknown_manager['row'].to_numpy()
+    df_unknown_manager = df_raw.iloc[manager_rows].copy()
+    df_unknown_manager['所属分公司'] = values.resolve(unknown_manager['branch'].to_numpy())
+    df_unknown_manager['补充客户经理'] = UNKNOWN
+    log(f"未知客户经理的数据条数: {len(df_unknown_manager)}")
+
+    if counts['invalid_date'] > 0:
+        log(f"注意：有{counts['invalid_date']}条数据的开票日期格式无效，已过滤")
+
+    rows = processed['row'].to_numpy()
+    df = df_raw.iloc[rows].copy()
+    df['所属分公司'] = values.resolve(processed['branch'].to_numpy())
+    df['补充客户经理'] = np.where(processed['has_manager'].to_numpy(),
+                                 np.asarray(df_raw['客户经理名称'].to_numpy(dtype=object))[rows],
+                                 values.resolve(processed['group'].to_numpy()))
+    df['开票日期'] = dates.iloc[rows].to_numpy()
+    df['回款天数'] = processed['days'].to_numpy()
+    df['催款类型'] = np.asarray(PAYMENT_TYPES, dtype=object)[processed['aging'].to_numpy()]
+
+    pivot_table = aging_pivot(pd.DataFrame({
+        '所属分公司': values.resolve(summary['branch'].to_numpy()),
+        '催款类型': np.asarray(PAYMENT_TYPES, dtype=object)[summary['aging'].to_numpy()],
+        '发票总金额': summary['amount'].to_numpy(),
+    }))
+    log(pivot_table)
+
+    results = {
+        '处理后的数据': df,
+        '数据汇总': pivot_table,
+        '未匹配分公司数据': df_unknown_branch,
+        '未匹配客户经理数据': df_unknown_manager,
+    }
+    for (sheet_name, category, days, with_director, with_leader), notice in zip(NOTICE_SHEETS, notices):
+        sub = df.iloc[np.searchsorted(rows, notice['row'].to_numpy())].copy()
+        if sub.empty:
+            results[sheet_name] = sub
+            continue
+        sub['收票日期'] = sub['开票日期'] + timedelta(days=days)
+        for name in CONTACTS:
+            wanted = {'总监': with_director, '总监电话': with_director,
+                      '分管领导': with_leader, '分管领导电话': with_leader}.get(name, True)
+            sub[name] = values.resolve(notice[name].to_numpy()) if wanted else ''
+        sub['短信模板'] = notice['message'].to_numpy()
+        results[sheet_name] = sub[NOTICE_COLUMNS]
+    return results
+
+
+def compare_engines(df_raw: pd.DataFrame, dims, exclusions=None, as_of=None, log=print) -> dict:
+    """
+    同一份数据分别用 pandas 和 polars 引擎处理并逐个 Sheet 比较，返回 {Sheet 名: 差异说明，一致时为 None}。
+    数据汇总的金额合计只因求和顺序不同可能有末位浮点误差，按相对误差 1e-9 比较，其余 Sheet 要求完全相同。
+    未指定 as_of 时两边使用同一个当前时间。
+    """
+    as_of = pd.Timestamp.now() if as_of is None else as_of
+    quiet = lambda *_: None
+    timings = {}
+    outputs = {}
+    for engine, func in (("pandas", excel_pipeline.transform), ("polars", transform)):
+        start = time.perf_counter()
+        outputs[engine] = func(df_raw, dims, exclusions, quiet, as_of=as_of)
+        timings[engine] = time.perf_counter() - start
+    log(" | ".join(f"{engine} {seconds:.2f}s" for engine, seconds in timings.items()))
+
+    expected, actual = outputs["pandas"], outputs["polars"]
+    if list(expected) != list(actual):
+        return {"Sheet": f"Sheet 不一致: {list(expected)} != {list(actual)}"}
+    diffs = {}
+    for name in expected:
+        exact = name not in excel_pipeline.INDEXED_SHEETS
+        try:
+            pd.testing.assert_frame_equal(expected[name], actual[name], check_dtype=False,
+                                          check_index_type=False, check_column_type=False,
+                                          check_exact=exact, rtol=1e-9)
+            diffs[name] = None
+        except AssertionError as e:
+            diffs[name] = str(e)
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="polars 引擎与 pandas 引擎的一致性检查")
+    parser.add_argument("--raw", required=True, help="原始数据文件")
+    parser.add_argument("--dims", required=True, help="维度表文件")
+    parser.add_argument("--exclude", default="", help="剔除工单号文件（可选）")
+    parser.add_argument("--as-of", default=None, help="统计日期（默认当前时间）")
+    args = parser.parse_args()
+
+    if not POLARS_AVAILABLE:
+        raise SystemExit("未安装 polars（pip install polars）")
+    df_raw, dims, exclusions = excel_pipeline.load_inputs(args.raw, args.dims, args.exclude, log=lambda *_: None)
+    diffs = compare_engines(df_raw, dims, exclusions, args.as_of)
+    for name, diff in diffs.items():
+        print(f"{name}: {'一致' if diff is None else '不一致'}")
+        if diff is not None:
+            print(diff)
+    if any(diff is not None for diff in diffs.values()):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
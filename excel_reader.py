@@ -0,0 +1,77 @@
+"""
+Excel 读取后端：安装了 python-calamine（Rust 实现的解析器）时用它读取 xlsx，否则使用 pandas 默认的 openpyxl。
+excel_pipeline（催款数据处理）和 send_plan（发送工具读取通报）的所有读取都经过这里。
+
+基准测试：python excel_reader.py 原始数据.xlsx [--repeat 3]
+"""
+import argparse
+import time
+
+import pandas as pd
+
+# =============== 可选依赖：python-calamine ==================
+try:
+    import python_calamine
+    CALAMINE_AVAILABLE = True
+except Exception:
+    python_calamine = None
+    CALAMINE_AVAILABLE = False
+
+# auto 时按顺序选择第一个可用的引擎
+ENGINES = ["calamine", "openpyxl"]
+
+
+def available_engines() -> list:
+    return [e for e in ENGINES if e != "calamine" or CALAMINE_AVAILABLE]
+
+
+def resolve_engine(engine: str = "auto") -> str:
+    """auto 选择最快的可用引擎；指定的引擎不可用时退回 openpyxl"""
+    if engine in (None, "", "auto"):
+        return available_engines()[0]
+    if engine == "calamine" and not CALAMINE_AVAILABLE:
+        return "openpyxl"
+    return engine
+
+
+def read_excel(path, engine: str = "auto", **kwargs):
+    """与 pd.read_excel 相同，按 engine 选择解析后端"""
+    return pd.read_excel(path, engine=resolve_engine(engine), **kwargs)
+
+
+def excel_file(path, engine: str = "auto") -> pd.ExcelFile:
+    return pd.ExcelFile(path, engine=resolve_engine(engine))
+
+
+def benchmark(path: str, engines=None, repeat: int = 3, sheet_name=0) -> dict:
+    """各引擎读取同一文件的耗时（取 repeat 次中的最短时间），返回 {引擎: 秒}"""
+    timings = {}
+    for engine in engines or available_engines():
+        best = None
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            read_excel(path, engine=engine, sheet_name=sheet_name)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[engine] = best
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Excel 读取后端基准测试")
+    parser.add_argument("path", help="Excel 文件")
+    parser.add_argument("--repeat", type=int, default=3, help="每个引擎读取次数（取最短时间）")
+    parser.add_argument("--sheet", default=0, help="Sheet 名或序号")
+    args = parser.parse_args()
+
+    sheet = int(args.sheet) if str(args.sheet).isdigit() else args.sheet
+    if not CALAMINE_AVAILABLE:
+        print("未安装 python-calamine（pip install python-calamine），仅测试 openpyxl")
+    timings = benchmark(args.path, repeat=args.repeat, sheet_name=sheet)
+    slowest = max(timings.values())
+    for engine, seconds in timings.items():
+        print(f"{engine:<10} {seconds:.2f}s  （{slowest / seconds:.1f}x）")
+
+
+if __name__ == '__main__':
+    main()
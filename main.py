@@ -1,9 +1,13 @@
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk
-import sender_app
-import excel_app   # 建议类名首字母大写，保持风格一致
+
+# sender_app / excel_app 会引入 pandas、numpy、PIL、pytesseract 等重量级依赖，
+# 延迟到首次点击按钮时再导入，使主入口窗口尽快出现
+
 
 def open_ocr():
+    import sender_app
     win = tk.Toplevel(root)   # 子窗口
     try:
         style = ttk.Style(win)
@@ -13,9 +17,12 @@ def open_ocr():
     sender_app.SenderApp(win)
 
 def open_excel():
+    import excel_app   # 建议类名首字母大写，保持风格一致
     excel_app.excel_app()
 
 if __name__ == '__main__':
+    # 打包后的程序中，excel_app 进程池的子进程会重新执行本入口，需在创建窗口前拦截
+    multiprocessing.freeze_support()
     root = tk.Tk()
     root.title("主入口")
     root.geometry("400x200")
@@ -0,0 +1,228 @@
+import csv
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+
+class SendJournal:
+    """
+    追加写入的发送日志（JSONL）。每条通知的发送尝试和结果都会立即落盘，
+    程序崩溃或被中断后重新运行时，可据此跳过已发送成功的通知。
+    """
+
+    STATUS_ATTEMPT = "attempt"
+    STATUS_OK = "ok"
+    STATUS_FAIL = "fail"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = None
+
+    @staticmethod
+    def notice_key(notice: dict) -> str:
+        """通知的唯一键：(sheet, 行号, 角色, 电话) + 消息摘要，避免不同月份的同一行被误判为已发送"""
+        digest = hashlib.sha1(str(notice['message']).encode('utf-8')).hexdigest()[:12]
+        return f"{notice['sheet']}|{notice['row']}|{notice['role']}|{notice['phone']}|{digest}"
+
+    def load(self) -> dict:
+        """读取日志，返回 {key: 最后状态}；末尾写了一半的行会被忽略"""
+        return {entry['key']: entry['status'] for entry in self.entries()}
+
+    def entries(self):
+        """逐条读出日志记录，跳过写了一半的行"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if 'key' in entry and 'status' in entry:
+                    yield entry
+
+    def merge_from(self, other_path: str) -> int:
+        """把另一份发送日志（如分片进程的日志）的记录追加到本日志，返回追加条数"""
+        count = 0
+        for entry in SendJournal(other_path).entries():
+            self._write(json.dumps(entry, ensure_ascii=False) + "\n")
+            count += 1
+        self._sync()
+        return count
+
+    def load_succeeded(self) -> set:
+        return {key for key, status in self.load().items() if status == self.STATUS_OK}
+
+    def _write(self, text: str):
+        if self._fh is None:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+            # 上次中断时可能留下没有换行的半行，先补换行避免与新记录粘连
+            if self._fh.tell() > 0:
+                with open(self.path, 'rb') as fh:
+                    fh.seek(-1, os.SEEK_END)
+                    if fh.read(1) != b"\n":
+                        self._fh.write("\n")
+        self._fh.write(text)
+
+    def _sync(self):
+        if self._fh is not None:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def record(self, notices: list, status: str, **extra):
+        """为一组通知各写一行记录，并立即 flush + fsync"""
+        ts = time.strftime("%Y-%m-%d %H:%M:%S")
+        for notice in notices:
+            entry = {
+                "ts": ts,
+                "key": self.notice_key(notice),
+                "sheet": notice['sheet'],
+                "row": int(notice['row']),
+                "role": notice['role'],
+                "phone": notice['phone'],
+                "status": status,
+            }
+            entry.update(extra)
+            self._write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._sync()
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+class FailureLog:
+    """
+    未发送名单的流式记录：每条失败通知立即追加到 CSV（来源 Sheet、行号、角色、电话、失败原因、尝试次数），
+    内存中只保留行号；结束时按行号从源数据中取出整行，写成可直接二次发送的 Excel。
+    """
+
+    COLUMNS = ["时间", "sheet", "row", "角色", "姓名", "电话", "失败原因", "尝试次数"]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = {}
+        self._fh = None
+        self._writer = None
+
+    def start(self):
+        """开始新一轮发送：清空上一轮的流式记录"""
+        self.close()
+        self.rows = {}
+        self._fh = open(self.path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._fh)
+        self._writer.writerow(self.COLUMNS)
+        self._fh.flush()
+
+    def record(self, notices: list, reason: str, attempts: int = 0):
+        if self._writer is None:
+            self.start()
+        ts = time.strftime("%Y-%m-%d %H:%M:%S")
+        for notice in notices:
+            sheet_rows = self.rows.setdefault(notice['sheet'], {})
+            row = int(notice['row'])
+            # 同一行多个角色失败时，合并原因
+            prev_reason, prev_attempts = sheet_rows.get(row, ('', 0))
+            reasons = [r for r in prev_reason.split("；") if r]
+            if reason not in reasons:
+                reasons.append(reason)
+            sheet_rows[row] = ("；".join(reasons), max(attempts, prev_attempts))
+            self._writer.writerow([ts, notice['sheet'], row, notice['role'], notice.get('name', ''),
+                                   notice['phone'], reason, attempts])
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.rows.values())
+
+    def export(self, sheets: dict, xlsx_path: str):
+        """按记录的行号从源 Sheet 取出失败行，附加失败原因和尝试次数后写入 Excel"""
+        import pandas as pd
+        with pd.ExcelWriter(xlsx_path, engine='openpyxl') as writer:
+            for sheet, rows in self.rows.items():
+                index = list(rows)
+                df_failed = sheets[sheet].loc[index].copy()
+                df_failed['失败原因'] = [rows[i][0] for i in index]
+                df_failed['尝试次数'] = [rows[i][1] for i in index]
+                df_failed.to_excel(writer, sheet_name=sheet, index=False)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+            self._writer = None
+
+
+class SendTelemetry:
+    """
+    发送耗时记录：每条消息各步骤的耗时（秒）逐条追加到 CSV，
+    结束时按步骤汇总 p50 / p95，写入同名的 “_汇总.json”。
+    """
+
+    # throttle 限速等待 / search 快捷键、输入号码与打开联系人 / search_wait 打开联系人后的等待（search_wait_sec）/
+    # contact_ocr 联系人截图与识别 / paste_send 粘贴与发送 / post_send_wait 发送后的等待（post_send_wait_sec）/
+    # message_ocr 消息截图与识别 / retry_wait 重试间隔 / total 整条消息
+    STEPS = ["throttle", "search", "search_wait", "contact_ocr", "paste_send", "post_send_wait", "message_ocr",
+             "retry_wait", "total"]
+    COLUMNS = ["时间", "电话", "姓名", "尝试次数", "结果"] + STEPS
+
+    def __init__(self, path: str):
+        self.path = path
+        self.summary_path = os.path.splitext(path)[0] + "_汇总.json"
+        self.rows = []
+        self._fh = None
+        self._writer = None
+
+    def start(self):
+        self.close()
+        self.rows = []
+        self._fh = open(self.path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._fh)
+        self._writer.writerow(self.COLUMNS)
+
+    def record(self, item: dict, ok: bool):
+        if self._writer is None:
+            self.start()
+        timings = item.get('timings') or {}
+        row = {step: float(timings.get(step, 0.0)) for step in self.STEPS}
+        self.rows.append(row)
+        self._writer.writerow([time.strftime("%Y-%m-%d %H:%M:%S"), item.get('phone', ''), item.get('name', ''),
+                               item.get('attempts', 0), "成功" if ok else "失败"]
+                              + [f"{row[step]:.3f}" for step in self.STEPS])
+        self._fh.flush()
+
+    @staticmethod
+    def summarize(rows: list, extra: dict = None) -> dict:
+        """按步骤统计 {步骤: {count, p50, p95, mean}}；extra 为其他来源的 {步骤: [耗时, ...]}（如 OCR 内部各阶段）"""
+        series = {step: [row.get(step, 0.0) for row in rows] for step in SendTelemetry.STEPS}
+        series.update(extra or {})
+        summary = {}
+        for step, values in series.items():
+            if not values:
+                continue
+            arr = np.asarray(values, dtype=float)
+            summary[step] = {"count": int(arr.size), "p50": float(np.percentile(arr, 50)),
+                             "p95": float(np.percentile(arr, 95)), "mean": float(arr.mean())}
+        return summary
+
+    @staticmethod
+    def format_summary(summary: dict) -> str:
+        return "\n".join(f"{step:<14} p50 {s['p50']:.3f}s | p95 {s['p95']:.3f}s | 平均 {s['mean']:.3f}s | n={s['count']}"
+                         for step, s in summary.items())
+
+    def close(self, extra: dict = None) -> dict:
+        """结束记录，写出并返回汇总（没有记录时返回空字典）"""
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+            self._writer = None
+        if not self.rows:
+            return {}
+        summary = self.summarize(self.rows, extra)
+        with open(self.summary_path, 'w', encoding='utf-8') as fh:
+            json.dump(summary, fh, ensure_ascii=False, indent=2)
+        return summary
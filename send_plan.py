@@ -0,0 +1,278 @@
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import excel_reader
+
+# ================== 收件人角色 ===========================
+ROLE_MANAGER = "客户经理"
+ROLE_DIRECTOR = "总监"
+ROLE_LEADER = "分管领导"
+
+
+NOTICE_COLUMNS = ["sheet", "row", "role", "name", "phone", "message", "amount", "days"]
+
+# 角色优先级，数值越小越先发送
+ROLE_PRIORITY = {ROLE_LEADER: 0, ROLE_DIRECTOR: 1, ROLE_MANAGER: 2}
+
+# 中国大陆手机号
+DEFAULT_PHONE_PATTERN = r"^1\d{10}$"
+
+
+def load_target_sheets(excel_path: str, target_sheets: list, engine: str = "auto") -> dict:
+    """
+    只读取存在的目标 Sheet，返回 {sheet 名: DataFrame}；engine 见 excel_reader。
+    超过 Excel 行数上限而被拆成 “名称_1”、“名称_2” …… 的 Sheet 会按顺序合并回一个。
+    """
+    with excel_reader.excel_file(excel_path, engine) as xls:
+        sheets = {}
+        for name in target_sheets:
+            if name in xls.sheet_names:
+                sheets[name] = pd.read_excel(xls, sheet_name=name)
+                continue
+            parts = [f"{name}_{k}" for k in range(1, len(xls.sheet_names) + 1)]
+            parts = [p for p in parts if p in xls.sheet_names]
+            if parts:
+                frames = pd.read_excel(xls, sheet_name=parts)
+                sheets[name] = pd.concat([frames[p] for p in parts], ignore_index=True)
+        return sheets
+
+
+def _text(df: pd.DataFrame, col: str) -> pd.Series:
+    """整列转为去空白字符串，缺列或空值为空串"""
+    if col not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    series = df[col]
+    return series.where(series.notna(), '').astype(str).str.strip()
+
+
+def normalize_phone(series: pd.Series) -> pd.Series:
+    """电话列标准化：空值为空串，去掉空白和连字符，以及 Excel 数值列带出的 “.0” 后缀"""
+    text = series.where(series.notna(), '').astype(str).str.strip()
+    text = text.str.replace(r"[\s\-]", '', regex=True).str.replace(r"\.0+$", '', regex=True)
+    return text.where(~text.isin(['nan', 'None', 'NaT']), '')
+
+
+def _numeric(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series(0.0, index=df.index)
+    return pd.to_numeric(df[col], errors='coerce').fillna(0.0)
+
+
+def _overdue_days(df: pd.DataFrame) -> pd.Series:
+    """回款天数：优先取表中的【回款天数】，否则按【开票日期】计算到今天"""
+    if '回款天数' in df.columns:
+        return _numeric(df, '回款天数').astype('int64')
+    if '开票日期' in df.columns:
+        invoice_date = pd.to_datetime(df['开票日期'], errors='coerce')
+        return (pd.Timestamp(datetime.today()) - invoice_date).dt.days.fillna(0).astype('int64')
+    return pd.Series(0, index=df.index, dtype='int64')
+
+
+def collect_notices(sheets: dict, target_sheets: list) -> pd.DataFrame:
+    """
+    将各通报 Sheet 按列展开为逐条通知（sheet, row, role, name, phone, message, amount, days）：
+    每行发给客户经理，非第一个通报 Sheet 追加总监，第三个通报 Sheet 再追加分管领导。
+    空电话、空消息的通知不生成。
+    """
+    first_sheet = target_sheets[0] if len(target_sheets) > 0 else None
+    third_sheet = target_sheets[2] if len(target_sheets) > 2 else None
+    parts = []
+    for sheet_order, sheet_name in enumerate(target_sheets):
+        df = sheets.get(sheet_name)
+        if not isinstance(df, pd.DataFrame) or df.empty:
+            continue
+        message = _text(df, '短信模板')
+        amount = _numeric(df, '发票总金额')
+        days = _overdue_days(df)
+        manager_name = _text(df, '补充客户经理')
+        manager_name = manager_name.where(manager_name != '', _text(df, '客户经理'))
+        recipients = [(ROLE_MANAGER, manager_name, '客户经理电话')]
+        if sheet_name != first_sheet:
+            recipients.append((ROLE_DIRECTOR, _text(df, '总监'), '总监电话'))
+        if sheet_name == third_sheet:
+            recipients.append((ROLE_LEADER, _text(df, '分管领导'), '分管领导电话'))
+        for role_order, (role, name, phone_col) in enumerate(recipients):
+            phone = normalize_phone(df[phone_col]) if phone_col in df.columns else _text(df, phone_col)
+            parts.append(pd.DataFrame({
+                "sheet": sheet_name,
+                "row": df.index.astype('int64'),
+                "role": role,
+                "name": name.values,
+                "phone": phone.values,
+                "message": message.values,
+                "amount": amount.values,
+                "days": days.values,
+                "_sheet_order": sheet_order,
+                "_role_order": role_order,
+            }))
+    if not parts:
+        return pd.DataFrame(columns=NOTICE_COLUMNS)
+    notices = pd.concat(parts, ignore_index=True)
+    notices = notices[(notices['phone'] != '') & (notices['message'] != '')]
+    # 保持原来的发送顺序：Sheet -> 行 -> 角色
+    notices = notices.sort_values(['_sheet_order', 'row', '_role_order'], kind='stable')
+    return notices[NOTICE_COLUMNS].reset_index(drop=True)
+
+
+def validate_notices(notices: pd.DataFrame, phone_pattern: str = DEFAULT_PHONE_PATTERN):
+    """按电话格式拆分为 (有效通知, 无效通知)"""
+    valid_mask = notices['phone'].str.match(phone_pattern)
+    return notices[valid_mask], notices[~valid_mask]
+
+
+def build_send_plan(notices, consolidate: bool = True, max_len: int = 500) -> list:
+    """
+    按收件人电话分组生成发送计划：同一电话的相同消息只发一次，
+    合并模式下同一收件人的多条消息用换行拼接，超过 max_len 时才拆分为多条。
+    每个计划项保留其覆盖的全部通知（notices），便于回写失败记录。
+    """
+    if isinstance(notices, pd.DataFrame):
+        notices = notices.to_dict('records')
+    by_phone = {}
+    for notice in notices:
+        group = by_phone.setdefault(notice['phone'], {"name": '', "roles": [], "messages": {}})
+        if not group['name'] and notice['name']:
+            group['name'] = notice['name']
+        if notice['role'] not in group['roles']:
+            group['roles'].append(notice['role'])
+        # 以消息文本为键去重，重复消息只记录来源
+        group['messages'].setdefault(notice['message'], []).append(notice)
+
+    plan = []
+    for phone, group in by_phone.items():
+        chunks = []
+        for message, sources in group['messages'].items():
+            if consolidate and chunks and len(chunks[-1]['message']) + 1 + len(message) <= max_len:
+                chunks[-1]['message'] += "\n" + message
+                chunks[-1]['notices'].extend(sources)
+            else:
+                chunks.append({"message": message, "notices": list(sources)})
+        for chunk in chunks:
+            # 同一行可能因多个角色出现多次，金额按行去重后汇总
+            rows = {(n['sheet'], n['row']): n for n in chunk['notices']}
+            plan.append({
+                "phone": phone,
+                "name": group['name'],
+                "role": "、".join(group['roles']),
+                "message": chunk['message'],
+                "notices": chunk['notices'],
+                "amount": float(sum(n.get('amount', 0) or 0 for n in rows.values())),
+                "days": int(max((n.get('days', 0) or 0 for n in rows.values()), default=0)),
+                "role_rank": min(ROLE_PRIORITY.get(n['role'], len(ROLE_PRIORITY)) for n in chunk['notices']),
+            })
+    return plan
+
+
+def prepare_send_plan(sheets: dict, cfg: dict, succeeded: set = None, log=print):
+    """
+    从已读取的通报 Sheet 生成发送计划：展开通知、校验电话、跳过 succeeded 中已发送成功的通知，
+    再按收件人合并去重。返回 (计划项列表, 无效电话的通知 DataFrame)。
+    """
+    from send_journal import SendJournal
+
+    target_sheets = list(cfg.get('target_sheets', []))
+    notices = collect_notices(sheets, target_sheets)
+    notices, invalid = validate_notices(notices, cfg.get('phone_pattern', DEFAULT_PHONE_PATTERN))
+    for n in invalid.itertuples(index=False):
+        log(f"无效电话 -> {n.sheet} 第 {n.row + 2} 行 {n.role} {n.name}: {n.phone}")
+    notices = notices.to_dict('records')
+    if succeeded:
+        remaining = [n for n in notices if SendJournal.notice_key(n) not in succeeded]
+        if len(remaining) < len(notices):
+            log(f"断点续发：发送记录中已有 {len(notices) - len(remaining)} 条通知发送成功，本次跳过")
+        notices = remaining
+    plan = build_send_plan(notices,
+                           consolidate=bool(cfg.get('consolidate_messages', True)),
+                           max_len=int(cfg.get('max_message_len', 500)))
+    log(f"发送计划：{len(notices)} 条通知，合并去重后 {len(plan)} 条消息")
+    return plan, invalid
+
+
+# ================== 调度：优先级、限速与预计剩余时间 ===========================
+PRIORITY_KEYS = {
+    "role": lambda item: item.get('role_rank', len(ROLE_PRIORITY)),
+    "amount": lambda item: -item.get('amount', 0.0),
+    "days": lambda item: -item.get('days', 0),
+}
+
+
+def prioritize(plan: list, order_by=None) -> list:
+    """按 order_by（role / amount / days 的组合，依次比较）排序，未指定时保持原顺序"""
+    keys = [PRIORITY_KEYS[k] for k in (order_by or []) if k in PRIORITY_KEYS]
+    if not keys:
+        return list(plan)
+    return sorted(plan, key=lambda item: tuple(k(item) for k in keys))
+
+
+class TokenBucket:
+    """令牌桶限速：平均每分钟 rate_per_min 次，最多连续突发 burst 次"""
+
+    def __init__(self, rate_per_min: float, burst: int = 1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate_per_min) / 60.0
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+
+    def acquire(self) -> float:
+        """取一个令牌，不足时阻塞等待，返回等待的秒数"""
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        wait = (1 - self.tokens) / self.rate
+        self.sleep(wait)
+        self.tokens = 0.0
+        self.updated = self.clock()
+        return wait
+
+
+class SendScheduler:
+    """
+    发送计划调度器：按优先级排序计划项，每次发送前通过 throttle() 限速，
+    并根据已完成项的平均耗时（及限速上限）估算剩余时间。
+    """
+
+    def __init__(self, plan: list, order_by=None, rate_per_min: float = 0.0, burst: int = 1):
+        self.items = prioritize(plan, order_by)
+        self.rate_per_min = float(rate_per_min or 0)
+        self.bucket = TokenBucket(self.rate_per_min, burst) if self.rate_per_min > 0 else None
+        self.total = len(self.items)
+        self.done = 0
+        self.started = None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return self.total
+
+    def throttle(self):
+        if self.started is None:
+            self.started = time.monotonic()
+        if self.bucket is not None:
+            self.bucket.acquire()
+
+    def mark_done(self):
+        self.done += 1
+
+    def eta_seconds(self) -> float:
+        remaining = self.total - self.done
+        if remaining <= 0:
+            return 0.0
+        eta = 0.0
+        if self.done and self.started is not None:
+            eta = (time.monotonic() - self.started) / self.done * remaining
+        if self.rate_per_min > 0:
+            eta = max(eta, remaining * 60.0 / self.rate_per_min)
+        return eta
+
+    def progress_text(self) -> str:
+        eta = int(self.eta_seconds())
+        return (f"进度 {self.done}/{self.total}，预计剩余 "
+                f"{eta // 3600:02d}:{eta % 3600 // 60:02d}:{eta % 60:02d}")
@@ -1,15 +1,24 @@
 import os
 import sys
 import time
-import difflib
+import hashlib
+import json
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 
+import numpy as np
 import pandas as pd
-import pyautogui
-import pyperclip
 
-from PIL import Image, ImageGrab, ImageOps, ImageFilter
+import excel_reader
+import send_plan
+from send_journal import SendJournal, FailureLog, SendTelemetry
+from PIL import Image, ImageGrab, ImageOps, ImageChops, ImageStat
 
 # =============== 可选依赖：pytesseract ==================
 try:
@@ -19,12 +28,33 @@ except Exception:
     pytesseract = None
     TESS_AVAILABLE = False
 
+# =============== 可选依赖：mss（常驻截图句柄）============
+try:
+    import mss
+    MSS_AVAILABLE = True
+except Exception:
+    mss = None
+    MSS_AVAILABLE = False
+
+# =============== 可选依赖：tesserocr（常驻引擎）==========
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except Exception:
+    tesserocr = None
+    TESSEROCR_AVAILABLE = False
+
+# 本地缓存目录（Tesseract 探测结果等）
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".excel_processing")
+
 # ================== 全局默认配置 ========================
 DEFAULT_CONFIG = {
     "excel_path": "",
     "target_sheets": ["30天通报", "60天通报", "90天通报"],
     "region_contact": None,
     "region_message": None,
+    # 搜索框及搜索结果所在区域：Ctrl+F 后出现搜索框、输入号码后出现结果，自适应等待据此判断搜索界面是否就绪
+    "region_search": None,
     "click_point": None,
     "tesseract_path": "C:\\Program Files\\Tesseract-OCR\\tesseract.exe",
     "ocr_lang": "chi_sim",
@@ -34,12 +64,340 @@ DEFAULT_CONFIG = {
     "search_wait_sec": 2.0,
     "use_ocr": True,
     "use_click": True,
+    # 自适应等待：轮询 OCR 区域，画面变化并稳定后立即继续，上面的等待时间仅作为超时上限
+    "adaptive_wait": True,
+    "hotkey_wait_sec": 0.8,
+    "type_wait_sec": 0.8,
+    "paste_wait_sec": 0.2,
+    "retry_wait_sec": 0.8,
+    "poll_interval_sec": 0.1,
+    "settle_polls": 2,
+    "change_threshold": 2.0,
+    # 按收件人电话合并消息，单条消息超过该长度时拆分
+    "consolidate_messages": True,
+    "max_message_len": 500,
+    # 发送日志：逐条落盘，重新运行时跳过已发送成功的通知
+    "resume_from_journal": True,
+    # 电话号码校验规则，不符合的通知在开始发送前剔除并写入未发送名单
+    "phone_pattern": send_plan.DEFAULT_PHONE_PATTERN,
+    # 发送优先级（role / amount / days 的组合）与限速（条/分钟，0 为不限速）
+    "priority_order": [],
+    "rate_limit_per_min": 0.0,
+    "rate_burst": 1,
+    # OCR 后端：auto 优先使用常驻的 tesserocr，不可用时退回 pytesseract；结果按图像哈希缓存
+    "ocr_backend": "auto",
+    "ocr_cache_size": 256,
+    # OCR 预处理步骤（按顺序执行）：grayscale / auto_invert / autocontrast / upscale / sharpen / binarize
+    "ocr_preprocess": ["grayscale", "auto_invert", "autocontrast", "upscale", "sharpen"],
+    "ocr_upscale": 2,
+    # 流水线模式：发送后只截图，消息 OCR 校验在后台线程进行，同时开始下一条的搜索和输入
+    "pipeline_verify": False,
+    # 变化检测：同一区域画面与上次识别时一致（超过容差的像素数不超过 ocr_gate_pixels）则直接复用上次的识别结果；
+    # 发送后消息区域与发送前一致时直接判为发送失败，不再做 OCR
+    "ocr_change_gate": True,
+    "ocr_gate_tolerance": 24,
+    "ocr_gate_pixels": 0,
+    "fail_fast_unchanged": True,
+    # 发送耗时记录：每条消息各步骤耗时写入 发送耗时.csv，结束时输出 p50 / p95 汇总
+    "telemetry": True,
+    # 读取通报 Excel 的解析引擎：auto（有 python-calamine 时用 calamine，否则 openpyxl）/ calamine / openpyxl
+    "excel_engine": "auto",
 }
 
 
+# ================== 截图层 ===========================
+class ScreenCapture:
+    """
+    屏幕截图层：每个线程持有一个常驻的 mss 截图句柄（未安装 mss 时退回 ImageGrab），
+    多个区域只截取一次外接矩形，再从中裁剪出各区域。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _handle(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None and MSS_AVAILABLE:
+            sct = mss.mss()
+            self._local.sct = sct
+        return sct
+
+    def grab(self, box) -> Image.Image:
+        x1, y1, x2, y2 = (int(v) for v in box)
+        sct = self._handle()
+        if sct is None:
+            return ImageGrab.grab(bbox=(x1, y1, x2, y2))
+        shot = sct.grab({"left": x1, "top": y1, "width": x2 - x1, "height": y2 - y1})
+        return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+    def grab_regions(self, regions) -> list:
+        """一次截图覆盖所有区域，返回与 regions 一一对应的裁剪图（未设置的区域为 None）"""
+        boxes = [tuple(int(v) for v in r) if r else None for r in regions]
+        valid = [b for b in boxes if b]
+        if not valid:
+            return [None] * len(boxes)
+        left = min(b[0] for b in valid)
+        top = min(b[1] for b in valid)
+        right = max(b[2] for b in valid)
+        bottom = max(b[3] for b in valid)
+        frame = self.grab((left, top, right, bottom))
+        return [frame.crop((b[0] - left, b[1] - top, b[2] - left, b[3] - top)) if b else None for b in boxes]
+
+
+# ================== 发送端交互接口 ===========================
+class Transport(ABC):
+    """
+    Sender 与聊天软件交互的接口：打开搜索、输入、点击、粘贴、回车和截图。
+    capture 属性提供 grab(box) / grab_regions(regions) 截图能力。
+    """
+    capture = None
+
+    def launch_app(self, app_name: str):
+        """启动聊天软件；默认不做任何事（如仿真环境）"""
+
+    @abstractmethod
+    def open_search(self):
+        ...
+
+    @abstractmethod
+    def type_text(self, text: str):
+        ...
+
+    @abstractmethod
+    def click(self, x, y):
+        ...
+
+    @abstractmethod
+    def paste(self, text: str):
+        ...
+
+    @abstractmethod
+    def press_enter(self):
+        ...
+
+
+class PyAutoGuiTransport(Transport):
+    """真实桌面：通过 pyautogui 模拟键鼠、pyperclip 写剪贴板"""
+
+    def __init__(self):
+        # 延迟导入：无桌面环境（如仿真、基准测试）时不需要这两个依赖
+        import pyautogui
+        import pyperclip
+        self.pyautogui = pyautogui
+        self.pyperclip = pyperclip
+        pyautogui.FAILSAFE = True
+        pyautogui.PAUSE = 0.05
+        self.capture = ScreenCapture()
+
+    def launch_app(self, app_name: str):
+        self.pyautogui.hotkey('win')
+        time.sleep(0.8)
+        self.pyperclip.copy(app_name)
+        self.pyautogui.hotkey('ctrl', 'v')
+        time.sleep(0.6)
+        self.pyautogui.press('enter')
+        time.sleep(1.0)
+        self.pyautogui.press('enter')
+        time.sleep(1.5)
+
+    def open_search(self):
+        self.pyautogui.hotkey('ctrl', 'f')
+
+    def type_text(self, text: str):
+        self.pyautogui.typewrite(str(text), interval=0.02)
+
+    def click(self, x, y):
+        self.pyautogui.click(x, y)
+
+    def paste(self, text: str):
+        self.pyperclip.copy(text)
+        self.pyautogui.hotkey('ctrl', 'v')
+
+    def press_enter(self):
+        self.pyautogui.press('enter')
+
+
+# ================== OCR 预处理 ===========================
+def preprocess_array(arr: np.ndarray, steps, upscale: int = 2) -> np.ndarray:
+    """NumPy 向量化预处理流水线，输入 RGB/灰度数组，输出 uint8 灰度数组"""
+    a = arr.astype(np.float32)
+    if a.ndim == 3:
+        # 与 PIL 的 L 模式转换系数一致
+        a = a[..., 0] * 0.299 + a[..., 1] * 0.587 + a[..., 2] * 0.114
+    for step in steps:
+        if step == "grayscale":
+            continue
+        elif step == "auto_invert":
+            # 深色背景（如深色聊天气泡）反色为白底黑字
+            if a.mean() < 128:
+                a = 255.0 - a
+        elif step == "autocontrast":
+            lo, hi = a.min(), a.max()
+            if hi > lo:
+                a = (a - lo) * (255.0 / (hi - lo))
+        elif step == "upscale":
+            if upscale and upscale > 1:
+                a = np.repeat(np.repeat(a, upscale, axis=0), upscale, axis=1)
+        elif step == "sharpen":
+            # 与 ImageFilter.SHARPEN 相同的卷积核：中心 32，周围 -2，除以 16
+            p = np.pad(a, 1, mode='edge')
+            neighbours = (p[:-2, :-2] + p[:-2, 1:-1] + p[:-2, 2:] + p[1:-1, :-2] +
+                          p[1:-1, 2:] + p[2:, :-2] + p[2:, 1:-1] + p[2:, 2:])
+            a = (32.0 * a - 2.0 * neighbours) / 16.0
+        elif step == "binarize":
+            a = np.where(a > _otsu_threshold(a), 255.0, 0.0)
+        a = np.clip(a, 0, 255)
+    return a.astype(np.uint8)
+
+
+def _otsu_threshold(a: np.ndarray) -> float:
+    hist = np.bincount(np.clip(a, 0, 255).astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    w0 = np.cumsum(hist)
+    w1 = w0[-1] - w0
+    m0 = np.cumsum(hist * levels)
+    mean0 = np.divide(m0, w0, out=np.zeros_like(m0), where=w0 > 0)
+    mean1 = np.divide(m0[-1] - m0, w1, out=np.zeros_like(m0), where=w1 > 0)
+    between = w0 * w1 * (mean0 - mean1) ** 2
+    return float(np.argmax(between))
+
+
+# ================== OCR 引擎 ===========================
+class PytesseractEngine:
+    """每次识别启动一个 tesseract 进程（兼容模式）"""
+    name = "pytesseract"
+
+    def image_to_string(self, img: Image.Image, lang: str) -> str:
+        return pytesseract.image_to_string(img, lang=lang)
+
+    def close(self):
+        pass
+
+
+class TesserocrEngine:
+    """常驻引擎：按语言保留已加载模型的 PyTessBaseAPI，跨调用复用"""
+    name = "tesserocr"
+
+    def __init__(self, tessdata_dir: str = None):
+        self.tessdata_dir = tessdata_dir
+        self._apis = {}
+        self._lock = threading.Lock()
+
+    def _api(self, lang: str):
+        api = self._apis.get(lang)
+        if api is None:
+            if self.tessdata_dir:
+                api = tesserocr.PyTessBaseAPI(path=self.tessdata_dir, lang=lang)
+            else:
+                api = tesserocr.PyTessBaseAPI(lang=lang)
+            self._apis[lang] = api
+        return api
+
+    def image_to_string(self, img: Image.Image, lang: str) -> str:
+        with self._lock:
+            api = self._api(lang)
+            api.SetImage(img)
+            return api.GetUTF8Text()
+
+    def close(self):
+        with self._lock:
+            for api in self._apis.values():
+                api.End()
+            self._apis.clear()
+
+
+def create_ocr_engine(backend: str = "auto", tesseract_path: str = None):
+    """按配置创建 OCR 引擎，tesserocr 不可用或初始化失败时退回 pytesseract"""
+    if backend in ("auto", "tesserocr") and TESSEROCR_AVAILABLE:
+        tessdata_dir = None
+        if tesseract_path:
+            candidate = os.path.join(os.path.dirname(tesseract_path), "tessdata")
+            if os.path.isdir(candidate):
+                tessdata_dir = candidate
+        try:
+            engine = TesserocrEngine(tessdata_dir)
+            engine._api(DEFAULT_CONFIG['ocr_lang'])
+            return engine
+        except Exception as e:
+            print(f"tesserocr 初始化失败，改用 pytesseract: {e}")
+    return PytesseractEngine()
+
+
+# ================== Tesseract 探测缓存 ===========================
+def _tesseract_fingerprint(cmd: str):
+    """Tesseract 可执行文件及其 tessdata 目录的指纹（路径、大小、修改时间），找不到时返回 None"""
+    path = cmd if os.path.isabs(cmd) else shutil.which(cmd)
+    if not path or not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    fingerprint = {"path": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime}
+    tessdata = os.path.join(os.path.dirname(path), "tessdata")
+    if os.path.isdir(tessdata):
+        fingerprint["tessdata_mtime"] = os.stat(tessdata).st_mtime
+    return fingerprint
+
+
+def probe_tesseract(cache_path: str = None):
+    """
+    返回 {"version": ..., "languages": [...]}；Tesseract 不可用时返回 None。
+    结果缓存在磁盘上，可执行文件或 tessdata 目录变化后自动失效，避免每次打开窗口都启动两次子进程。
+    """
+    cache_path = cache_path or os.path.join(CACHE_DIR, "tesseract_probe.json")
+    cmd = pytesseract.pytesseract.tesseract_cmd
+    fingerprint = _tesseract_fingerprint(cmd)
+    if fingerprint is not None:
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as fh:
+                cached = json.load(fh)
+            if cached.get("fingerprint") == fingerprint:
+                return cached["probe"]
+        except (OSError, ValueError, KeyError):
+            pass
+    try:
+        probe = {
+            "version": str(pytesseract.get_tesseract_version()),
+            "languages": list(pytesseract.get_languages(config='')),
+        }
+    except Exception:
+        return None
+    if fingerprint is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as fh:
+                json.dump({"fingerprint": fingerprint, "probe": probe}, fh, ensure_ascii=False)
+        except OSError:
+            pass
+    return probe
+
+
 # ================== OCR & 截图管理类 ===========================
 class OCRManager:
-    def __init__(self, tesseract_path: str = None):
+    def __init__(self, tesseract_path: str = None, backend: str = "auto", cache_size: int = 256,
+                 preprocess_steps=None, upscale: int = 2, engine=None, capture=None,
+                 change_gate: bool = True, gate_tolerance: int = 24, gate_pixels: int = 0):
+        self.cache_size = max(0, int(cache_size))
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # 变化检测：{(区域名, 语言): (上次识别的灰度图, 识别结果)}
+        self.change_gate = bool(change_gate)
+        self.gate_tolerance = int(gate_tolerance)
+        self.gate_pixels = int(gate_pixels)
+        self._gate = {}
+        self.gate_hits = 0
+        # 各阶段耗时 {阶段: [秒, ...]}，由 drain_timings() 取出
+        self._timings = defaultdict(list)
+        self.capture = capture or ScreenCapture()
+        if preprocess_steps is None:
+            preprocess_steps = DEFAULT_CONFIG['ocr_preprocess']
+        self.preprocess_steps = list(preprocess_steps)
+        self.upscale = int(upscale)
+
+        # 外部指定引擎（如仿真）时跳过 Tesseract 检查
+        if engine is not None:
+            self.engine = engine
+            self.tesseract_available = True
+            return
+
         self.tesseract_available = TESS_AVAILABLE
         if self.tesseract_available and tesseract_path:
             try:
@@ -49,35 +407,48 @@ class OCRManager:
                 self.tesseract_available = False
                 sys.exit(1)
 
-        # 检查 Tesseract 是否真正可用
+        # 检查 Tesseract 是否真正可用（探测结果有磁盘缓存）
+        probe = None
         if self.tesseract_available:
-            try:
-                _ = pytesseract.get_tesseract_version()
-            except Exception:
+            probe = probe_tesseract()
+            if probe is None:
                 messagebox.showerror("Tesseract 未安装", "未检测到 Tesseract，请使用软件包的文件进行安装。")
                 self.tesseract_available = False
                 sys.exit(1)
 
         # 检查语言包是否存在
         lang = "chi_sim"
-        available_langs = pytesseract.get_languages(config='')
-        if lang not in available_langs:
+        if probe is not None and lang not in probe['languages']:
             messagebox.showerror("缺少语言包", f"缺少语言包 '{lang}'，请将“chi_sim.traineddata” "
                                                r"文件放置到 “C:\Program Files\Tesseract-OCR\tessdata” 文件夹下。")
             sys.exit(1)
 
+        self.engine = create_ocr_engine(backend, tesseract_path)
 
     def _preprocess_for_ocr(self, img: Image.Image) -> Image.Image:
-        g = ImageOps.grayscale(img)
-        g = ImageOps.autocontrast(g)
-        g = g.filter(ImageFilter.SHARPEN)
-        return g
+        arr = preprocess_array(np.asarray(img), self.preprocess_steps, self.upscale)
+        return Image.fromarray(arr)
 
     def _grab_region(self, region):
         if not region:
             return None
-        box = (int(region[0]), int(region[1]), int(region[2]), int(region[3]))
-        return ImageGrab.grab(bbox=box)
+        return self.capture.grab(region)
+
+    def grab_regions(self, regions) -> list:
+        start = time.perf_counter()
+        imgs = self.capture.grab_regions(regions)
+        self._add_timing("ocr_capture", time.perf_counter() - start)
+        return imgs
+
+    def _add_timing(self, step: str, seconds: float):
+        with self._cache_lock:
+            self._timings[step].append(seconds)
+
+    def drain_timings(self) -> dict:
+        """取出并清空累计的各阶段耗时"""
+        with self._cache_lock:
+            timings, self._timings = dict(self._timings), defaultdict(list)
+        return timings
 
     def recognize_text(self, region, lang='chi_sim') -> str:
         if not self.tesseract_available:
@@ -85,22 +456,163 @@ class OCRManager:
         img = self._grab_region(region)
         if img is None:
             return ""
-        img = self._preprocess_for_ocr(img)
+        return self.recognize_crop(img, lang)
+
+    def recognize_crop(self, img: Image.Image, lang='chi_sim', slot: str = None) -> str:
+        """
+        识别已截取的区域图像（先预处理）。给定 slot（如 "contact" / "message"）时，
+        若画面与该区域上次识别时相同，直接返回上次的结果，跳过预处理和 OCR。
+        """
+        if not self.tesseract_available or img is None:
+            return ""
+        fp = None
+        if slot is not None and self.change_gate:
+            fp = self.fingerprint(img)
+            with self._cache_lock:
+                prev = self._gate.get((slot, lang))
+            if prev is not None and self.same_image(prev[0], fp):
+                self.gate_hits += 1
+                return prev[1]
+        start = time.perf_counter()
+        prepared = self._preprocess_for_ocr(img)
+        mid = time.perf_counter()
+        text = self.recognize_image(prepared, lang)
+        self._add_timing("ocr_preprocess", mid - start)
+        self._add_timing("ocr_engine", time.perf_counter() - mid)
+        if fp is not None:
+            with self._cache_lock:
+                self._gate[(slot, lang)] = (fp, text)
+        return text
+
+    def recognize_image(self, img: Image.Image, lang='chi_sim') -> str:
+        """识别已预处理的图像；相同图像（按像素哈希）直接返回缓存结果"""
+        key = (hashlib.sha1(img.tobytes()).hexdigest(), img.size, img.mode, lang)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
         try:
-            text = pytesseract.image_to_string(img, lang=lang)
+            text = self.engine.image_to_string(img, lang)
             cleaned_text = (text or '').replace(' ', '').replace('\n', '').strip()
-            return cleaned_text
         except Exception as e:
             print(f"OCR 识别失败: {e}")
             return ""
+        if self.cache_size:
+            with self._cache_lock:
+                self._cache[key] = cleaned_text
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return cleaned_text
+
+    def close(self):
+        self.engine.close()
+
+    def snapshot(self, region):
+        """截取区域的低分辨率灰度缩略图，仅用于判断画面是否变化"""
+        return self.thumbnail(self._grab_region(region))
+
+    @staticmethod
+    def thumbnail(img):
+        """区域截图 -> 与 snapshot 相同的缩略图，用于以已有截图作为等待的基准画面"""
+        if img is None:
+            return None
+        g = ImageOps.grayscale(img)
+        if min(g.size) >= 32:
+            g = g.reduce(4)
+        return g
+
+    @staticmethod
+    def fingerprint(img):
+        """区域截图的全分辨率灰度数组，用于逐像素比较"""
+        if img is None:
+            return None
+        return np.asarray(ImageOps.grayscale(img), dtype=np.int16)
+
+    def same_image(self, a, b) -> bool:
+        """两个 fingerprint 是否视为同一画面：差值超过 gate_tolerance 的像素不超过 gate_pixels 个"""
+        if a is None or b is None or a.shape != b.shape:
+            return False
+        return int(np.count_nonzero(np.abs(a - b) > self.gate_tolerance)) <= self.gate_pixels
 
     @staticmethod
-    def ratio(a: str, b: str) -> float:
-        a = (a or '').strip()
-        b = (b or '').strip()
-        if not a or not b:
+    def image_diff(a, b) -> float:
+        """两张缩略图的平均像素差（0~255），尺寸不同视为完全变化"""
+        if a is None or b is None:
             return 0.0
-        return difflib.SequenceMatcher(None, a, b).ratio()
+        if a.size != b.size:
+            return 255.0
+        return ImageStat.Stat(ImageChops.difference(a, b)).mean[0]
+
+    def wait_for_change(self, region, baseline=None, timeout: float = 2.0, interval: float = 0.1,
+                        settle_polls: int = 2, threshold: float = 2.0, require_change: bool = True) -> bool:
+        """
+        轮询区域直到画面相对 baseline 发生变化、且连续 settle_polls 次不再变化。
+        require_change=False 时只等待画面稳定。超时返回 False，否则返回 True。
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        if not region:
+            time.sleep(max(0.0, timeout))
+            return False
+        if baseline is None:
+            baseline = self.snapshot(region)
+        prev = baseline
+        changed = not require_change
+        stable = 0
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            cur = self.snapshot(region)
+            if not changed:
+                if self.image_diff(cur, baseline) > threshold:
+                    changed = True
+            elif self.image_diff(cur, prev) <= threshold:
+                stable += 1
+                if stable >= settle_polls:
+                    return True
+            else:
+                stable = 0
+            prev = cur
+        return False
+
+    @staticmethod
+    def partial_ratio(pattern: str, text: str, threshold: float = None) -> float:
+        """
+        pattern 与 text 中最相近片段的相似度：1 - 最小编辑距离 / len(pattern)。
+        使用 Myers 位并行近似匹配，线性扫描 text；给定 threshold 时一旦达到即提前返回。
+        """
+        pattern = (pattern or '').strip()
+        text = (text or '').strip()
+        m = len(pattern)
+        if not m or not text:
+            return 0.0
+        peq = {}
+        for i, ch in enumerate(pattern):
+            peq[ch] = peq.get(ch, 0) | (1 << i)
+        full = (1 << m) - 1
+        high = 1 << (m - 1)
+        pv, mv = full, 0
+        score = best = m
+        # 允许的最大编辑距离，达到即可提前结束
+        k = -1 if threshold is None else int((1.0 - threshold) * m + 1e-9)
+        for ch in text:
+            eq = peq.get(ch, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = (mv | ~(xh | pv)) & full
+            mh = pv & xh
+            if ph & high:
+                score += 1
+            elif mh & high:
+                score -= 1
+            # 片段可从 text 任意位置开始，因此左移时不补 1
+            ph = (ph << 1) & full
+            mh = (mh << 1) & full
+            pv = (mh | ~(xv | ph)) & full
+            mv = ph & xv
+            if score < best:
+                best = score
+                if best <= k:
+                    break
+        return 1.0 - best / m
 
     def select_region_gui(self) -> tuple:
         capture_app = self._ScreenCaptureGUI()
@@ -173,15 +685,41 @@ class OCRManager:
             self.root.destroy()
 
 # ================== 发送 & 验证 ==========================
+# 失败原因
+REASON_CONTACT = "联系人校验失败"
+REASON_MESSAGE = "消息校验失败"
+REASON_EXCEPTION = "发送异常"
+REASON_INVALID_PHONE = "电话无效"
+REASON_UNCHANGED = "发送后消息区域无变化"
+
 class Sender:
-    def __init__(self, cfg, log_func, ocr_manager: OCRManager):
+    def __init__(self, cfg, log_func, ocr_manager: OCRManager, transport: Transport = None):
         self.cfg = cfg
         self.log = log_func
-        pyautogui.FAILSAFE = True
-        pyautogui.PAUSE = 0.05
         self.ocr_manager = ocr_manager
+        self.transport = transport or PyAutoGuiTransport()
+        # 每次发送前调用的限速函数（如 SendScheduler.throttle）
+        self.throttle = None
+        # 最近一次发送的失败原因与尝试次数
+        self.last_failure = None
+        self.last_attempts = 0
+        # 当前消息各步骤的累计耗时（秒），见 SendTelemetry.STEPS
+        self.timings = {}
+
+    @contextmanager
+    def _timed(self, step: str, timings: dict = None):
+        timings = self.timings if timings is None else timings
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[step] = timings.get(step, 0.0) + time.perf_counter() - start
+
+    def _capture_check(self) -> list:
+        """一次截图同时取得 [联系人区域, 消息区域]，两块都要用到；未设置的区域为 None"""
+        return self.ocr_manager.grab_regions([self.cfg.get('region_contact'), self.cfg.get('region_message')])
 
-    def verify_contact(self, expected_name: str) -> bool:
+    def verify_contact(self, expected_name: str, img: Image.Image = None) -> bool:
         if not self.cfg.get('use_ocr'):
             return True
         if not expected_name:
@@ -190,76 +728,373 @@ class Sender:
         if not region:
             self.log("未设置联系人 OCR 区域，跳过联系人校验")
             return True
-        text = self.ocr_manager.recognize_text(region, self.cfg.get('ocr_lang', 'chi_sim'))
+        if img is None:
+            img = self.ocr_manager.grab_regions([region])[0]
+        text = self.ocr_manager.recognize_crop(img, self.cfg.get('ocr_lang', 'chi_sim'), slot="contact")
         self.log(f"[OCR-联系人] 期望: {expected_name} | 识别: {text}")
         if not text:
             return False
         th = float(self.cfg.get('ocr_threshold', 0.7))
-        return (expected_name in text) or (self.ocr_manager.ratio(expected_name, text) >= th)
+        return (expected_name in text) or (self.ocr_manager.partial_ratio(expected_name, text, th) >= th)
 
-    def verify_message(self, message: str) -> bool:
+    def _same_contact(self, expected_name: str, before, after) -> bool:
+        """发送后的联系人区域与校验时画面相同即视为未变化，否则重新 OCR 校验"""
+        if not self.cfg.get('use_ocr') or before is None or after is None:
+            return True
+        if self.ocr_manager.same_image(self.ocr_manager.fingerprint(before), self.ocr_manager.fingerprint(after)):
+            return True
+        return self.verify_contact(expected_name, after)
+
+    def verify_message(self, message: str, img: Image.Image = None) -> bool:
         if not self.cfg.get('use_ocr'):
             return True
         region = self.cfg.get('region_message')
         if not region:
             self.log("未设置消息 OCR 区域，跳过消息校验")
             return True
-        text = self.ocr_manager.recognize_text(region, self.cfg.get('ocr_lang', 'chi_sim'))
+        if img is None:
+            img = self.ocr_manager.grab_regions([region])[0]
+        text = self.ocr_manager.recognize_crop(img, self.cfg.get('ocr_lang', 'chi_sim'), slot="message")
+        return self.check_message(message, text)
+
+    def check_message(self, message: str, text: str) -> bool:
+        """判断已识别的消息区域文本是否包含 message"""
+        # OCR 结果已去除空格和换行，合并消息也按同样方式比对
+        message = (message or '').replace(' ', '').replace('\n', '')
         frag_head = (message or '')[:14]
         frag_tail = (message or '')[-14:]
         self.log(f"[OCR-消息] 识别到: {text}")
         if not text:
             return False
         th = float(self.cfg.get('ocr_threshold', 0.7))
-        rules = [
-            (message and message in text),
-            (frag_head and frag_head in text),
-            (frag_tail and frag_tail in text),
-            self.ocr_manager.ratio(message, text) >= th,
-        ]
-        return any(rules)
+        # 依次判断，命中即返回；最后按消息与识别文本中最相近片段的相似度判断
+        if message and message in text:
+            return True
+        if frag_head and frag_head in text:
+            return True
+        if frag_tail and frag_tail in text:
+            return True
+        return self.ocr_manager.partial_ratio(message, text, th) >= th
+
+    def _search_probe_region(self):
+        """
+        搜索阶段用于判断画面变化的区域：优先取搜索区域，其次点击坐标附近（搜索结果列表），否则取联系人区域。
+        后两者在按下 Ctrl+F 时不一定变化，此时等待到 hotkey_wait_sec 超时为止。
+        """
+        if self.cfg.get('region_search'):
+            return self.cfg['region_search']
+        if self.cfg.get('use_click') and self.cfg.get('click_point'):
+            x, y = self.cfg['click_point']
+            return int(x) - 60, int(y) - 15, int(x) + 60, int(y) + 15
+        return self.cfg.get('region_contact')
+
+    def _snapshot(self, region):
+        if not self.cfg.get('adaptive_wait') or not region:
+            return None
+        return self.ocr_manager.snapshot(region)
+
+    def _wait(self, region, baseline, timeout: float, require_change: bool = True) -> bool:
+        """自适应等待：画面变化并稳定后立即返回；未启用或未设置区域时退化为固定等待"""
+        if not self.cfg.get('adaptive_wait') or not region:
+            time.sleep(timeout)
+            return False
+        return self.ocr_manager.wait_for_change(
+            region, baseline=baseline, timeout=timeout,
+            interval=float(self.cfg.get('poll_interval_sec', 0.1)),
+            settle_polls=int(self.cfg.get('settle_polls', 2)),
+            threshold=float(self.cfg.get('change_threshold', 2.0)),
+            require_change=require_change,
+        )
+
+    def _deliver(self, phone_number: str, message: str, contact_name: str = None):
+        """
+        搜索联系人、校验联系人并发送消息，返回 (是否已发送, 发送后的消息区域截图)。
+        消息校验由调用方完成；未发送时失败原因记录在 last_failure。
+        """
+        self.last_failure = None
+        try:
+            if self.throttle:
+                with self._timed("throttle"):
+                    self.throttle()
+            probe = self._search_probe_region()
+            region_contact = self.cfg.get('region_contact')
+            region_message = self.cfg.get('region_message')
+            with self._timed("search"):
+                base_contact = self._snapshot(region_contact)
+                # 搜索框出现、搜索结果出现都必须在画面上看到变化才继续，等待时间只作为超时上限
+                base_probe = self._snapshot(probe)
+                self.transport.open_search()
+                self._wait(probe, base_probe, float(self.cfg.get('hotkey_wait_sec', 0.8)))
+                base_probe = self._snapshot(probe)
+                self.transport.type_text(str(phone_number))
+                self._wait(probe, base_probe, float(self.cfg.get('type_wait_sec', 0.8)))
+                if self.cfg.get('use_click'):
+                    x, y = self.cfg['click_point']
+                    self.transport.click(x, y)
+                else:
+                    self.transport.press_enter()
+            with self._timed("search_wait"):
+                self._wait(region_contact, base_contact, float(self.cfg.get('search_wait_sec', 2.0)))
+            expected = contact_name or str(phone_number)
+            with self._timed("contact_ocr"):
+                # 同一次截图：联系人区域用于校验，消息区域作为发送前的基准画面
+                contact_img, message_before = self._capture_check()
+                contact_ok = self.verify_contact(expected, contact_img)
+            if not contact_ok:
+                self.log(f"联系人校验失败 -> 期望: {expected}")
+                self.last_failure = REASON_CONTACT
+                return False, None
+            with self._timed("paste_send"):
+                self.transport.paste(message)
+                time.sleep(float(self.cfg.get('paste_wait_sec', 0.2)))
+                self.transport.press_enter()
+            with self._timed("post_send_wait"):
+                base_message = self.ocr_manager.thumbnail(message_before) if self.cfg.get('adaptive_wait') else None
+                self._wait(region_message, base_message, float(self.cfg.get('post_send_wait_sec', 2.0)))
+            with self._timed("message_ocr"):
+                # 同一次截图：消息区域用于消息校验，联系人区域用于确认发送期间仍停留在该联系人
+                contact_after, after = self._capture_check()
+            if not self._same_contact(expected, contact_img, contact_after):
+                self.log(f"发送后联系人已变化 -> 期望: {expected}")
+                self.last_failure = REASON_CONTACT
+                return False, None
+            fail_fast = bool(self.cfg.get('use_ocr') and self.cfg.get('fail_fast_unchanged') and region_message)
+            # 消息区域与发送前完全一致，消息基本可以确定没有发出，无需再做 OCR
+            if fail_fast and self.ocr_manager.same_image(self.ocr_manager.fingerprint(message_before),
+                                                         self.ocr_manager.fingerprint(after)):
+                self.log("发送后消息区域无变化，判定为发送失败")
+                self.last_failure = REASON_UNCHANGED
+                return False, None
+            return True, after
+        except Exception as e:
+            self.log(f"发送异常: {e}")
+            self.last_failure = REASON_EXCEPTION
+            return False, None
 
     def send_one(self, phone_number: str, message: str, contact_name: str = None) -> bool:
+        sent, img = self._deliver(phone_number, message, contact_name)
+        if not sent:
+            return False
         try:
-            pyautogui.hotkey('ctrl', 'f')
-            time.sleep(0.8)
-            pyautogui.typewrite(str(phone_number), interval=0.02)
-            time.sleep(0.8)
-            if self.cfg.get('use_click'):
-                x, y = self.cfg['click_point']
-                pyautogui.click(x, y)
-            else:
-                pyautogui.press('enter')
-            time.sleep(self.cfg.get('search_wait_sec', 2.0))
-            if not self.verify_contact(contact_name or str(phone_number)):
-                self.log(f"联系人校验失败 -> 期望: {contact_name or phone_number}")
-                return False
-            pyperclip.copy(message)
-            pyautogui.hotkey('ctrl', 'v')
-            time.sleep(0.2)
-            pyautogui.press('enter')
-            time.sleep(self.cfg.get('post_send_wait_sec', 2.0))
-            if not self.verify_message(message):
-                return False
-            return True
+            with self._timed("message_ocr"):
+                verified = self.verify_message(message, img)
+            if verified:
+                return True
+            self.last_failure = REASON_MESSAGE
+            return False
         except Exception as e:
             self.log(f"发送异常: {e}")
+            self.last_failure = REASON_EXCEPTION
             return False
 
     def send_with_retry(self, phone_number: str, message: str, contact_name: str = None) -> bool:
         retries = int(self.cfg.get('max_retries', 1))
         for i in range(1, retries + 1):
+            self.last_attempts = i
             ok = self.send_one(phone_number, message, contact_name)
             if ok:
                 self.log(f"✅ 发送成功 -> {contact_name or phone_number}")
                 return True
             else:
                 self.log(f"验证失败/异常，第 {i} 次尝试")
-                time.sleep(0.8)
+                with self._timed("retry_wait"):
+                    time.sleep(float(self.cfg.get('retry_wait_sec', 0.8)))
         self.log(f"发送失败 -> {contact_name or phone_number}")
         return False
 
+    def send_all(self, items: list, on_attempt=None, on_done=None):
+        """
+        依次发送计划项（含 phone / message / name），每项开始时回调 on_attempt(item)，
+        结束时回调 on_done(item, ok)，此时 item['attempts'] 为尝试次数，失败时 item['reason'] 为失败原因，
+        item['timings'] 为各步骤耗时。启用 pipeline_verify 时走流水线模式。
+        """
+        if self.cfg.get('pipeline_verify') and self.cfg.get('use_ocr') and self.cfg.get('region_message'):
+            self._send_all_pipelined(items, on_attempt, on_done)
+            return
+        for item in items:
+            if on_attempt:
+                on_attempt(item)
+            self.last_failure, self.last_attempts = None, 0
+            self.timings = item['timings'] = {}
+            start = time.perf_counter()
+            try:
+                ok = self.send_with_retry(item['phone'], item['message'], contact_name=item['name'] or None)
+            except Exception as e:
+                self.log(f"发送 {item['name'] or item['phone']} 异常: {e}")
+                self.last_failure = REASON_EXCEPTION
+                ok = False
+            item['attempts'] = self.last_attempts
+            item['reason'] = None if ok else (self.last_failure or REASON_EXCEPTION)
+            item['timings']['total'] = time.perf_counter() - start
+            if on_done:
+                on_done(item, ok)
+
+    def _send_all_pipelined(self, items: list, on_attempt=None, on_done=None):
+        """
+        流水线发送：第 N 条发送后只截取消息区域，OCR 放到后台线程，
+        主线程立即开始第 N+1 条的搜索和输入；校验失败的项重新放回队列重试。
+        """
+        retries = int(self.cfg.get('max_retries', 1))
+        lang = self.cfg.get('ocr_lang', 'chi_sim')
+        queue = deque((item, 1) for item in items)
+        pending = {}
+        started = {}
+        # 后台识别结束的时刻：total 截止到识别完成，而不是主线程下一条发送完后才收集结果的时刻
+        ended = {}
+
+        def finish(item, attempt, ok, reason=None):
+            name = item['name'] or item['phone']
+            item['attempts'] = attempt
+            item['reason'] = None if ok else reason
+            item['timings']['total'] = ended.pop(id(item), time.perf_counter()) - started[id(item)]
+            if ok:
+                self.log(f"✅ 发送成功 -> {name}")
+            elif attempt < retries:
+                self.log(f"验证失败/异常，第 {attempt} 次尝试，稍后重试")
+                queue.append((item, attempt + 1))
+                return
+            else:
+                self.log(f"发送失败 -> {name}")
+            started.pop(id(item), None)
+            if on_done:
+                on_done(item, ok)
+
+        def recognize(item, img):
+            # 后台线程中识别，耗时计入该项自己的 timings
+            try:
+                with self._timed("message_ocr", item['timings']):
+                    return self.ocr_manager.recognize_crop(img, lang, "message")
+            finally:
+                ended[id(item)] = time.perf_counter()
+
+        def collect(done):
+            for fut in done:
+                item, attempt = pending.pop(fut)
+                reason = REASON_MESSAGE
+                try:
+                    ok = self.check_message(item['message'], fut.result())
+                except Exception as e:
+                    self.log(f"消息校验异常: {e}")
+                    ok, reason = False, REASON_EXCEPTION
+                finish(item, attempt, ok, reason)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            while queue or pending:
+                collect([fut for fut in list(pending) if fut.done()])
+                if not queue:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    collect(done)
+                    continue
+                item, attempt = queue.popleft()
+                if attempt == 1:
+                    if on_attempt:
+                        on_attempt(item)
+                    item['timings'] = {}
+                    started[id(item)] = time.perf_counter()
+                self.timings = item['timings']
+                sent, img = self._deliver(item['phone'], item['message'], item['name'] or None)
+                if not sent:
+                    finish(item, attempt, False, self.last_failure or REASON_EXCEPTION)
+                    if attempt < retries:
+                        with self._timed("retry_wait", item['timings']):
+                            time.sleep(float(self.cfg.get('retry_wait_sec', 0.8)))
+                    continue
+                pending[executor.submit(recognize, item, img)] = (item, attempt)
+
+def create_ocr_manager(cfg: dict, capture=None) -> OCRManager:
+    return OCRManager(tesseract_path=cfg.get('tesseract_path'),
+                      backend=cfg.get('ocr_backend', 'auto'),
+                      cache_size=cfg.get('ocr_cache_size', 256),
+                      preprocess_steps=cfg.get('ocr_preprocess'),
+                      upscale=cfg.get('ocr_upscale', 2),
+                      capture=capture,
+                      change_gate=cfg.get('ocr_change_gate', True),
+                      gate_tolerance=cfg.get('ocr_gate_tolerance', 24),
+                      gate_pixels=cfg.get('ocr_gate_pixels', 0))
+
+
+def run_send_plan(sender: Sender, scheduler, journal: SendJournal, failure_log: FailureLog, on_progress=None,
+                  telemetry: SendTelemetry = None):
+    """按调度器发送计划，逐条写入发送日志、失败记录和（可选的）耗时记录，返回 (成功数, 失败数)"""
+    counts = {"ok": 0, "fail": 0}
+    if telemetry is not None:
+        telemetry.start()
+        sender.ocr_manager.drain_timings()
+
+    def on_attempt(item):
+        journal.record(item['notices'], SendJournal.STATUS_ATTEMPT)
+
+    def on_done(item, ok):
+        journal.record(item['notices'], SendJournal.STATUS_OK if ok else SendJournal.STATUS_FAIL)
+        if telemetry is not None:
+            telemetry.record(item, ok)
+        scheduler.mark_done()
+        if on_progress:
+            on_progress()
+        if ok:
+            counts['ok'] += 1
+            return
+        counts['fail'] += 1
+        failure_log.record(item['notices'], item.get('reason') or REASON_EXCEPTION, item.get('attempts', 0))
+
+    sender.throttle = scheduler.throttle
+    try:
+        sender.send_all(scheduler, on_attempt=on_attempt, on_done=on_done)
+    finally:
+        sender.throttle = None
+        journal.close()
+        failure_log.close()
+        if telemetry is not None:
+            summary = telemetry.close(extra=sender.ocr_manager.drain_timings())
+            if summary:
+                sender.log(f"各步骤耗时（明细见 {telemetry.path}）:\n{SendTelemetry.format_summary(summary)}")
+    return counts['ok'], counts['fail']
+
+
+def run_shard(shard_path: str) -> dict:
+    """
+    分片发送进程入口（python sender_app.py --worker 分片文件.json）：
+    在当前显示会话中按分片文件的配置和计划项发送，发送日志、失败记录和结果写到分片指定的路径。
+    """
+    with open(shard_path, 'r', encoding='utf-8') as fh:
+        shard = json.load(fh)
+    cfg = DEFAULT_CONFIG.copy()
+    cfg.update(shard['cfg'])
+
+    def log(msg):
+        print(msg, flush=True)
+
+    transport = PyAutoGuiTransport()
+    sender = Sender(cfg, log, create_ocr_manager(cfg, transport.capture), transport)
+    # 分片内的计划项已按优先级排好序
+    scheduler = send_plan.SendScheduler(shard['items'],
+                                        rate_per_min=float(cfg.get('rate_limit_per_min', 0) or 0),
+                                        burst=int(cfg.get('rate_burst', 1)))
+    try:
+        transport.launch_app("移动办公")
+    except Exception as e:
+        log(f"尝试启动应用失败（可忽略，若已打开）: {e}")
+
+    failure_log = FailureLog(shard['failure_log_path'])
+    failure_log.start()
+    telemetry = SendTelemetry(shard['telemetry_path']) if cfg.get('telemetry') and shard.get('telemetry_path') else None
+    okcnt, failcnt = run_send_plan(sender, scheduler, SendJournal(shard['journal_path']), failure_log,
+                                   on_progress=lambda: log(scheduler.progress_text()), telemetry=telemetry)
+    result = {"total": len(scheduler), "ok": okcnt, "fail": failcnt}
+    with open(shard['result_path'], 'w', encoding='utf-8') as fh:
+        json.dump(result, fh, ensure_ascii=False)
+    log(f"分片完成。总计: {result['total']} | 成功: {okcnt} | 失败: {failcnt}")
+    return result
+
+
 # ================== GUI 主程序 ===========================
+# 界面上可选的发送优先级
+PRIORITY_PRESETS = {
+    "原始顺序": [],
+    "分管领导优先": ["role", "amount"],
+    "金额优先": ["amount"],
+    "逾期天数优先": ["days", "amount"],
+}
 
 class SenderApp:
     def __init__(self, root):
@@ -271,12 +1106,17 @@ class SenderApp:
 
         self.base_dir = os.path.dirname(os.path.abspath(__file__))
         self.failed_file_path = os.path.join(self.base_dir, "未发送消息.xlsx")
+        self.journal_path = os.path.join(self.base_dir, "发送记录.jsonl")
+        self.failure_log_path = os.path.join(self.base_dir, "未发送记录.csv")
+        self.telemetry_path = os.path.join(self.base_dir, "发送耗时.csv")
 
-        self.ocr_manager = OCRManager(tesseract_path=self.cfg.get('tesseract_path'))
-        self.sender = Sender(self.cfg, self.log, self.ocr_manager)
+        self.transport = PyAutoGuiTransport()
+        self.ocr_manager = create_ocr_manager(self.cfg, self.transport.capture)
+        self.sender = Sender(self.cfg, self.log, self.ocr_manager, self.transport)
 
         self.build_ui()
-        self.update_button_states(os.path.exists(self.failed_file_path))
+        self.update_button_states(self._has_failed_file())
+        self.log(f"OCR 引擎: {self.ocr_manager.engine.name}")
 
     # ---------- UI ----------
     def build_ui(self):
@@ -293,6 +1133,8 @@ class SenderApp:
         self.use_click = tk.BooleanVar(value=bool(self.cfg.get('use_click', True)))
         ttk.Button(frm_click, text="选择确认区域", command=self.choose_click_point).grid(row=0, column=1,
                                                                                           padx=pad, pady=pad)
+        ttk.Button(frm_click, text="选择搜索区域", command=self.choose_search_region).grid(row=0, column=2,
+                                                                                          padx=pad, pady=pad)
         ttk.Checkbutton(frm_click, text="启用 鼠标点击", variable=self.use_click).grid(row=0, column=0,
                                                                                        sticky='w',
                                                                                        padx=pad,
@@ -335,6 +1177,25 @@ class SenderApp:
         ttk.Label(frm_retry, text="发送后等待(s)").grid(row=0, column=4, sticky='e', padx=pad)
         self.var_post_wait = tk.DoubleVar(value=float(self.cfg.get('post_send_wait_sec', 2.0)))
         ttk.Entry(frm_retry, textvariable=self.var_post_wait, width=6).grid(row=0, column=5, sticky='w', padx=pad)
+        self.adaptive_wait = tk.BooleanVar(value=bool(self.cfg.get('adaptive_wait', True)))
+        ttk.Checkbutton(frm_retry, text="自适应等待（画面稳定即继续）", variable=self.adaptive_wait).grid(
+            row=1, column=0, columnspan=4, sticky='w', padx=pad, pady=pad)
+        self.consolidate = tk.BooleanVar(value=bool(self.cfg.get('consolidate_messages', True)))
+        ttk.Checkbutton(frm_retry, text="按收件人合并消息", variable=self.consolidate).grid(
+            row=1, column=4, columnspan=2, sticky='w', padx=pad, pady=pad)
+        self.resume = tk.BooleanVar(value=bool(self.cfg.get('resume_from_journal', True)))
+        ttk.Checkbutton(frm_retry, text="断点续发（跳过发送记录中已成功的通知）", variable=self.resume).grid(
+            row=2, column=0, columnspan=4, sticky='w', padx=pad, pady=pad)
+        self.pipeline = tk.BooleanVar(value=bool(self.cfg.get('pipeline_verify', False)))
+        ttk.Checkbutton(frm_retry, text="流水线校验（后台 OCR）", variable=self.pipeline).grid(
+            row=2, column=4, columnspan=2, sticky='w', padx=pad, pady=pad)
+        ttk.Label(frm_retry, text="发送优先级").grid(row=3, column=0, sticky='w', padx=pad)
+        self.var_priority = tk.StringVar(value=self._priority_label(self.cfg.get('priority_order', [])))
+        ttk.Combobox(frm_retry, textvariable=self.var_priority, values=list(PRIORITY_PRESETS), width=14,
+                     state='readonly').grid(row=3, column=1, columnspan=2, sticky='w', padx=pad, pady=pad)
+        ttk.Label(frm_retry, text="限速(条/分钟，0不限)").grid(row=3, column=3, columnspan=2, sticky='e', padx=pad)
+        self.var_rate = tk.DoubleVar(value=float(self.cfg.get('rate_limit_per_min', 0.0)))
+        ttk.Entry(frm_retry, textvariable=self.var_rate, width=6).grid(row=3, column=5, sticky='w', padx=pad)
 
         frm_btn = ttk.Frame(self.root)
         frm_btn.pack(fill=tk.X, padx=pad, pady=pad)
@@ -342,22 +1203,37 @@ class SenderApp:
         self.btn_open_failed = ttk.Button(frm_btn, text="未发送名单", command=self.open_failed_file, state='disabled')
         self.btn_open_failed.pack(side=tk.LEFT)
         ttk.Button(frm_btn, text="使用说明", command=self.show_instructions).pack(side=tk.LEFT, padx=pad)
+        self.var_progress = tk.StringVar(value="")
+        ttk.Label(frm_btn, textvariable=self.var_progress).pack(side=tk.LEFT, padx=pad)
 
         frm_log = ttk.LabelFrame(self.root, text="日志")
         frm_log.pack(fill=tk.BOTH, expand=True, padx=pad, pady=pad)
         self.txt_log = tk.Text(frm_log, height=18)
         self.txt_log.pack(fill=tk.BOTH, expand=True, padx=pad, pady=pad)
 
+    @staticmethod
+    def _priority_label(order_by) -> str:
+        for label, preset in PRIORITY_PRESETS.items():
+            if list(preset) == list(order_by or []):
+                return label
+        return next(iter(PRIORITY_PRESETS))
+
     def update_button_states(self, has_failed_file: bool):
         if has_failed_file:
             self.btn_open_failed.config(state='normal')
         else:
             self.btn_open_failed.config(state='disabled')
 
+    def _has_failed_file(self) -> bool:
+        return os.path.exists(self.failed_file_path) or os.path.exists(self.failure_log_path)
+
     def open_failed_file(self):
-        if os.path.exists(self.failed_file_path):
+        # 上次运行中断时只有流式记录的 CSV（比旧的汇总 Excel 更新），此时打开 CSV
+        existing = [p for p in (self.failed_file_path, self.failure_log_path) if os.path.exists(p)]
+        path = max(existing, key=os.path.getmtime) if existing else self.failed_file_path
+        if os.path.exists(path):
             try:
-                os.startfile(self.failed_file_path)
+                os.startfile(path)
             except Exception as e:
                 messagebox.showerror("错误", f"无法打开文件: {e}")
                 self.log(f"无法打开文件: {e}")
@@ -377,6 +1253,8 @@ class SenderApp:
             "* 在程序运行时，请勿移动鼠标或操作键盘。\n"
             "* 在开始处理前，请确保您的通讯软件已打开，并处于可以搜索联系人的状态。\n"
             "* OCR 验证失败时，程序会自动重试。\n"
+            "* 每条通知的发送结果会实时写入“发送记录.jsonl”，程序中断后重新开始处理同一文件，将自动跳过已发送成功的通知。\n"
+            "* 启用“自适应等待”时，搜索等待和发送后等待仅作为超时上限，界面刷新完成后立即继续。\n"
         )
         messagebox.showinfo("使用说明", instructions)
 
@@ -404,6 +1282,15 @@ class SenderApp:
         else:
             self.log("点击区域选择取消或无效")
 
+    def choose_search_region(self):
+        messagebox.showinfo("提示", "请选取【搜索框及搜索结果】所在区域")
+        region = self.ocr_manager.select_region_gui()
+        if region:
+            self.cfg['region_search'] = region
+            self.log(f"搜索区域: {region}")
+        else:
+            self.log("搜索区域选择取消或无效")
+
     def choose_contact_region(self):
         messagebox.showinfo("提示", "请选取【联系人名称】所在区域")
         region = self.ocr_manager.select_region_gui()
@@ -456,6 +1343,12 @@ class SenderApp:
         self.cfg['search_wait_sec'] = float(self.var_search_wait.get())
         self.cfg['post_send_wait_sec'] = float(self.var_post_wait.get())
         self.cfg['use_ocr'] = bool(self.use_ocr.get())
+        self.cfg['adaptive_wait'] = bool(self.adaptive_wait.get())
+        self.cfg['consolidate_messages'] = bool(self.consolidate.get())
+        self.cfg['resume_from_journal'] = bool(self.resume.get())
+        self.cfg['pipeline_verify'] = bool(self.pipeline.get())
+        self.cfg['priority_order'] = list(PRIORITY_PRESETS.get(self.var_priority.get(), []))
+        self.cfg['rate_limit_per_min'] = float(self.var_rate.get())
 
         if self.cfg['use_click'] and not self.cfg.get('click_point'):
             # 弹出警告框，让用户决定是否继续
@@ -465,104 +1358,73 @@ class SenderApp:
             )
             return
 
+        target_sheets = list(self.cfg.get('target_sheets', []))
+        engine = excel_reader.resolve_engine(self.cfg.get('excel_engine', 'auto'))
+        self.log(f"读取通报 Excel（解析引擎: {engine}）")
         try:
-            sheets = pd.read_excel(excel_path, sheet_name=None)
+            sheets = send_plan.load_target_sheets(excel_path, target_sheets, engine)
         except Exception as e:
             messagebox.showerror("错误", f"无法读取 Excel: {e}")
             return
+        for sheet_name in target_sheets:
+            df = sheets.get(sheet_name)
+            if not isinstance(df, pd.DataFrame) or df.empty:
+                self.log(f"Sheet {sheet_name} 为空，跳过")
+
+        # 在启动自动化之前构建并校验发送计划
+        journal = SendJournal(self.journal_path)
+        succeeded = journal.load_succeeded() if self.cfg.get('resume_from_journal') else None
+        plan, invalid = send_plan.prepare_send_plan(sheets, self.cfg, succeeded, log=self.log)
+        if not invalid.empty:
+            if not messagebox.askyesno("电话校验",
+                                       f"发现 {len(invalid)} 条通知的电话格式无效（详见日志），"
+                                       f"这些通知将写入未发送名单。\n是否继续发送其余通知？"):
+                return
+        scheduler = send_plan.SendScheduler(plan,
+                                            order_by=self.cfg.get('priority_order'),
+                                            rate_per_min=float(self.cfg.get('rate_limit_per_min', 0) or 0),
+                                            burst=int(self.cfg.get('rate_burst', 1)))
+        self.var_progress.set(scheduler.progress_text())
 
         try:
-            pyautogui.hotkey('win')
-            time.sleep(0.8)
-            pyperclip.copy("移动办公")
-            pyautogui.hotkey('ctrl', 'v')
-            time.sleep(0.6)
-            pyautogui.press('enter')
-            time.sleep(1.0)
-            pyautogui.press('enter')
-            time.sleep(1.5)
+            self.sender.transport.launch_app("移动办公")
         except Exception as e:
             self.log(f"尝试启动应用失败（可忽略，若已打开）: {e}")
 
-        tgt = set(self.cfg.get('target_sheets', []))
-        total, okcnt, failcnt = 0, 0, 0
-        failed_sends_by_sheet = {}
-
-        for sheet_name, df in sheets.items():
-            if sheet_name not in tgt:
-                continue
-            self.log(f"==== 处理 Sheet: {sheet_name} ====")
-            if not isinstance(df, pd.DataFrame) or df.empty:
-                self.log(f"Sheet {sheet_name} 为空，跳过")
-                continue
-            for idx, row in df.iterrows():
-                try:
-                    is_failed = False
-                    phone_manager = str(row.get('客户经理电话', '')).strip()
-                    msg = str(row.get('短信模板', '')).strip()
-                    contact_name = str(row.get('补充客户经理', '')).strip() or str(row.get('客户经理', '')).strip()
-                    if phone_manager and msg:
-                        total += 1
-                        ok = self.sender.send_with_retry(phone_manager, msg, contact_name=contact_name or None)
-                        if ok:
-                            okcnt += 1
-                        else:
-                            failcnt += 1
-                            is_failed = True
-                    if sheet_name != self.cfg.get('target_sheets', [])[0]:
-                        phone_dir = str(row.get('总监电话', '')).strip()
-                        name_dir = str(row.get('总监', '')).strip()
-                        if phone_dir and msg:
-                            total += 1
-                            ok = self.sender.send_with_retry(phone_dir, msg, contact_name=name_dir or None)
-                            if ok:
-                                okcnt += 1
-                            else:
-                                failcnt += 1
-                                is_failed = True
-                    if sheet_name == self.cfg.get('target_sheets', [None, None, ''])[2]:
-                        phone_lead = str(row.get('分管领导电话', '')).strip()
-                        name_lead = str(row.get('分管领导', '')).strip()
-                        if phone_lead and msg:
-                            total += 1
-                            ok = self.sender.send_with_retry(phone_lead, msg, contact_name=name_lead or None)
-                            if ok:
-                                okcnt += 1
-                            else:
-                                failcnt += 1
-                                is_failed = True
-                    if is_failed:
-                        if sheet_name not in failed_sends_by_sheet:
-                            failed_sends_by_sheet[sheet_name] = []
-                        failed_sends_by_sheet[sheet_name].append(row)
-                except Exception as e:
-                    self.log(f"行 {idx + 1} 处理异常: {e}")
-                    if sheet_name not in failed_sends_by_sheet:
-                        failed_sends_by_sheet[sheet_name] = []
-                    failed_sends_by_sheet[sheet_name].append(row)
-
+        # 失败通知实时写入 CSV，只保留行号，结束时再按行号汇总成 Excel
+        failure_log = FailureLog(self.failure_log_path)
+        failure_log.start()
+        if not invalid.empty:
+            failure_log.record(invalid.to_dict('records'), REASON_INVALID_PHONE)
+
+        total = len(plan)
+        telemetry = SendTelemetry(self.telemetry_path) if self.cfg.get('telemetry') else None
+        okcnt, failcnt = run_send_plan(self.sender, scheduler, journal, failure_log,
+                                       on_progress=lambda: self.var_progress.set(scheduler.progress_text()),
+                                       telemetry=telemetry)
         self.log(f"完成。总计: {total} | 成功: {okcnt} | 失败: {failcnt}")
         messagebox.showinfo("发送结果", f"发送完成！\n成功: {okcnt} 条\n失败: {failcnt} 条")
 
-        if failed_sends_by_sheet:
+        if len(failure_log):
             try:
-                with pd.ExcelWriter(self.failed_file_path, engine='openpyxl') as writer:
-                    for sheet, failed_rows in failed_sends_by_sheet.items():
-                        df_failed = pd.DataFrame(failed_rows)
-                        df_failed.to_excel(writer, sheet_name=sheet, index=False)
+                failure_log.export(sheets, self.failed_file_path)
                 self.update_button_states(True)
                 self.log(f"⚠️ {failcnt} 条发送失败，已自动保存至 {self.failed_file_path}。您可以通过点击“未发送名单”按钮来查看详情，"
                          f"并可将此文件作为新的数据源进行二次发送。")
             except Exception as e:
-                self.log(f"保存失败文件时出错: {e}")
+                self.log(f"保存失败文件时出错: {e}（失败明细已实时记录在 {self.failure_log_path}）")
                 messagebox.showerror("错误", f"保存失败文件时出错: {e}")
         else:
-            if os.path.exists(self.failed_file_path):
-                os.remove(self.failed_file_path)
+            for path in (self.failed_file_path, self.failure_log_path):
+                if os.path.exists(path):
+                    os.remove(path)
             self.update_button_states(False)
             self.log("🎉 所有信息发送成功，没有失败记录")
 
 if __name__ == '__main__':
-    root = tk.Tk()
-    SenderApp(root)
-    root.mainloop()
\ No newline at end of file
+    if len(sys.argv) > 2 and sys.argv[1] == '--worker':
+        run_shard(sys.argv[2])
+    else:
+        root = tk.Tk()
+        SenderApp(root)
+        root.mainloop()
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""
+多会话分片发送：把发送计划按收件人分成若干片，每片交给一个独立的发送进程，
+各进程在自己的显示会话（如 Linux 上的 Xvfb 虚拟显示 :1、:2）中使用自己的点击坐标和 OCR 区域，
+最后把各进程的发送日志、失败记录合并回主程序使用的 发送记录.jsonl / 未发送消息.xlsx。
+
+会话文件（JSON 列表）示例：
+    [
+        {"display": ":1", "region_contact": [0, 0, 400, 40], "region_message": [0, 50, 400, 450],
+         "click_point": [200, 500]},
+        {"display": ":2", "region_contact": [...], "region_message": [...], "click_point": [...],
+         "env": {"XAUTHORITY": "/tmp/xauth2"}}
+    ]
+除 display / env 外的键都会覆盖该进程的发送配置。
+
+用法：python shard_sender.py --excel 通报.xlsx --sessions sessions.json [--workdir 目录]
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+import excel_reader
+import send_plan
+from send_journal import SendJournal, FailureLog
+from sender_app import DEFAULT_CONFIG, REASON_INVALID_PHONE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SENDER_SCRIPT = os.path.join(BASE_DIR, "sender_app.py")
+
+# 分片进程没有写出结果（崩溃或被终止）时，其未确认成功的通知记为此原因
+REASON_WORKER_ABORTED = "分片进程中断"
+
+
+def load_sessions(path: str) -> list:
+    with open(path, 'r', encoding='utf-8') as fh:
+        sessions = json.load(fh)
+    if not isinstance(sessions, list) or not sessions:
+        raise ValueError("会话文件应为非空的 JSON 列表")
+    return sessions
+
+
+def shard_plan(plan: list, n: int) -> list:
+    """
+    按收件人电话把计划项分成 n 片：同一收件人的消息只落在一个分片（避免两个会话同时给同一人发送、
+    打乱消息顺序），按条数从多到少依次分给当前最少的分片；分片内保持计划原有的优先级顺序。
+    """
+    n = max(1, int(n))
+    counts = {}
+    for item in plan:
+        counts[item['phone']] = counts.get(item['phone'], 0) + 1
+    loads = [0] * n
+    assign = {}
+    for phone, count in sorted(counts.items(), key=lambda kv: -kv[1]):
+        k = loads.index(min(loads))
+        assign[phone] = k
+        loads[k] += count
+    shards = [[] for _ in range(n)]
+    for item in plan:
+        shards[assign[item['phone']]].append(item)
+    return shards
+
+
+def _json_default(value):
+    """计划项中来自 DataFrame 的 numpy 标量转为 Python 原生类型"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"无法序列化 {type(value).__name__}")
+
+
+def _launch_worker(index: int, session: dict, items: list, cfg: dict, workdir: str, log):
+    prefix = os.path.join(workdir, f"shard_{index}")
+    shard = {
+        "cfg": dict(cfg, **{k: v for k, v in session.items() if k not in ('display', 'env')}),
+        "items": items,
+        "journal_path": prefix + "_发送记录.jsonl",
+        "failure_log_path": prefix + "_未发送记录.csv",
+        "result_path": prefix + "_result.json",
+        "telemetry_path": prefix + "_发送耗时.csv",
+    }
+    # 清掉上一轮同名分片的结果，避免把旧结果当作本轮结果合并
+    for path in (shard['journal_path'], shard['failure_log_path'], shard['result_path']):
+        if os.path.exists(path):
+            os.remove(path)
+    shard_path = prefix + ".json"
+    with open(shard_path, 'w', encoding='utf-8') as fh:
+        json.dump(shard, fh, ensure_ascii=False, default=_json_default)
+
+    env = os.environ.copy()
+    if session.get('display'):
+        env['DISPLAY'] = str(session['display'])
+    env.update({k: str(v) for k, v in (session.get('env') or {}).items()})
+    log_fh = open(prefix + ".log", 'w', encoding='utf-8')
+    proc = subprocess.Popen([sys.executable, SENDER_SCRIPT, "--worker", shard_path],
+                            env=env, stdout=log_fh, stderr=subprocess.STDOUT, cwd=BASE_DIR)
+    log(f"分片 {index}：{len(items)} 条消息 -> 显示 {session.get('display') or '(当前)'}，日志 {prefix}.log")
+    return proc, log_fh, shard
+
+
+def _merge_failures(shard: dict, failure_log: FailureLog) -> set:
+    """把分片的失败记录并入总失败记录，返回已记录的 (sheet, row, role, phone)"""
+    recorded = set()
+    if not os.path.exists(shard['failure_log_path']):
+        return recorded
+    with open(shard['failure_log_path'], 'r', encoding='utf-8-sig', newline='') as fh:
+        for rec in csv.DictReader(fh):
+            notice = {"sheet": rec['sheet'], "row": int(rec['row']), "role": rec['角色'],
+                      "name": rec['姓名'], "phone": rec['电话']}
+            failure_log.record([notice], rec['失败原因'], int(rec['尝试次数'] or 0))
+            recorded.add((notice['sheet'], notice['row'], notice['role'], notice['phone']))
+    return recorded
+
+
+def run_sharded(excel_path: str, sessions: list, workdir: str = None, cfg: dict = None, log=print) -> dict:
+    """生成发送计划并分片到多个会话并行发送，等待全部结束后合并结果，返回汇总"""
+    cfg = dict(DEFAULT_CONFIG, **(cfg or {}))
+    workdir = workdir or os.path.join(BASE_DIR, "分片发送")
+    os.makedirs(workdir, exist_ok=True)
+
+    engine = excel_reader.resolve_engine(cfg.get('excel_engine', 'auto'))
+    log(f"读取通报 Excel（解析引擎: {engine}）")
+    sheets = send_plan.load_target_sheets(excel_path, list(cfg.get('target_sheets', [])), engine)
+    journal = SendJournal(os.path.join(BASE_DIR, "发送记录.jsonl"))
+    succeeded = journal.load_succeeded() if cfg.get('resume_from_journal') else None
+    plan, invalid = send_plan.prepare_send_plan(sheets, cfg, succeeded, log=log)
+    plan = send_plan.prioritize(plan, cfg.get('priority_order'))
+    shards = shard_plan(plan, len(sessions))
+
+    workers = []
+    for index, (session, items) in enumerate(zip(sessions, shards)):
+        if items:
+            workers.append((items,) + _launch_worker(index, session, items, cfg, workdir, log))
+
+    failure_log = FailureLog(os.path.join(BASE_DIR, "未发送记录.csv"))
+    failure_log.start()
+    if not invalid.empty:
+        failure_log.record(invalid.to_dict('records'), REASON_INVALID_PHONE)
+
+    summary = {"total": len(plan), "ok": 0, "fail": 0}
+    try:
+        for items, proc, log_fh, shard in workers:
+            code = proc.wait()
+            log_fh.close()
+            journal.merge_from(shard['journal_path'])
+            recorded = _merge_failures(shard, failure_log)
+            if os.path.exists(shard['result_path']):
+                with open(shard['result_path'], 'r', encoding='utf-8') as fh:
+                    result = json.load(fh)
+                summary['ok'] += result['ok']
+                summary['fail'] += result['fail']
+                continue
+            # 分片进程异常退出：以其发送日志为准，未确认成功的计划项记为失败
+            log(f"⚠️ 分片进程异常退出（返回码 {code}），详见 {os.path.splitext(shard['result_path'])[0]}")
+            states = SendJournal(shard['journal_path']).load()
+            for item in items:
+                if all(states.get(SendJournal.notice_key(n)) == SendJournal.STATUS_OK for n in item['notices']):
+                    summary['ok'] += 1
+                    continue
+                summary['fail'] += 1
+                missing = [n for n in item['notices']
+                           if (n['sheet'], int(n['row']), n['role'], n['phone']) not in recorded]
+                if missing:
+                    failure_log.record(missing, REASON_WORKER_ABORTED)
+    finally:
+        journal.close()
+        failure_log.close()
+
+    failed_path = os.path.join(BASE_DIR, "未发送消息.xlsx")
+    if len(failure_log):
+        failure_log.export(sheets, failed_path)
+        log(f"⚠️ 未发送名单已保存至 {failed_path}")
+    log(f"完成。总计: {summary['total']} | 成功: {summary['ok']} | 失败: {summary['fail']}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话分片发送")
+    parser.add_argument("--excel", required=True, help="通报 Excel 文件")
+    parser.add_argument("--sessions", required=True, help="会话配置 JSON 文件")
+    parser.add_argument("--workdir", default=None, help="分片文件和进程日志目录")
+    args = parser.parse_args()
+    run_sharded(args.excel, load_sessions(args.sessions), args.workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+仿真发送端：在无桌面环境（如 Linux 服务器）下模拟“移动办公”的联系人栏和聊天窗口，
+用于调试等待时间、重试策略，并测量吞吐量和 OCR 误拒率。
+
+用法：python sim_transport.py --messages 100 --ocr-error-rate 0.02 [--pipeline]
+"""
+import argparse
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from send_journal import SendTelemetry
+from sender_app import DEFAULT_CONFIG, OCRManager, Sender, Transport
+
+# 仿真屏幕布局
+SIM_LAYOUT = {
+    "region_contact": (0, 0, 400, 40),
+    "region_message": (0, 50, 400, 450),
+    "region_search_box": (0, 455, 400, 475),
+    "region_results": (0, 480, 400, 520),
+    # 发送端配置的搜索区域：搜索框和搜索结果
+    "region_search": (0, 455, 400, 520),
+    "click_point": (200, 500),
+}
+
+# 仿真延迟（秒）与故障率的默认值
+SIM_DEFAULTS = {
+    "hotkey_latency": 0.05,
+    "search_latency": 0.15,
+    "open_latency": 0.3,
+    "send_latency": 0.25,
+    "jitter": 0.3,             # 延迟随机浮动比例
+    "search_miss_rate": 0.0,   # 搜索结果点开了错误的联系人
+    "send_drop_rate": 0.0,     # 消息未发出
+    "ocr_error_rate": 0.0,     # OCR 单字符识别错误率
+}
+
+
+def _encode(text: str, size) -> np.ndarray:
+    """
+    把文本的 UTF-8 字节（以 0 结尾）逐像素写入灰度图左上角，供仿真 OCR 解码；
+    其余像素用以文本为种子的噪声填满，使任意文本变化都表现为整块画面变化。
+    """
+    w, h = size
+    data = np.frombuffer(text.encode('utf-8')[:w * h - 1] + b"\0", dtype=np.uint8)
+    seed = zlib.crc32(data.tobytes())
+    arr = np.random.default_rng(seed).integers(0, 256, w * h, dtype=np.uint8)
+    arr[:len(data)] = data
+    return arr.reshape(h, w)
+
+
+class SimulatedOCREngine:
+    """从仿真画面解码出真实文本，并按 ocr_error_rate 随机替换字符模拟识别错误"""
+    name = "simulated"
+
+    def __init__(self, error_rate: float = 0.0, seed: int = None):
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def image_to_string(self, img: Image.Image, lang: str) -> str:
+        raw = np.asarray(img, dtype=np.uint8).tobytes().split(b"\0", 1)[0]
+        text = raw.decode('utf-8', errors='ignore')
+        if not self.error_rate:
+            return text
+        with self._lock:
+            return ''.join('口' if self._rng.random() < self.error_rate else ch for ch in text)
+
+    def close(self):
+        pass
+
+
+class SimulatedCapture:
+    """按当前仿真状态渲染屏幕，提供与 ScreenCapture 相同的 grab / grab_regions"""
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    def grab(self, box) -> Image.Image:
+        x1, y1, x2, y2 = (int(v) for v in box)
+        screen = self.transport.render()
+        canvas = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+        for region, arr in screen:
+            rx1, ry1, rx2, ry2 = region
+            ix1, iy1, ix2, iy2 = max(x1, rx1), max(y1, ry1), min(x2, rx2), min(y2, ry2)
+            if ix1 >= ix2 or iy1 >= iy2:
+                continue
+            canvas[iy1 - y1:iy2 - y1, ix1 - x1:ix2 - x1] = arr[iy1 - ry1:iy2 - ry1, ix1 - rx1:ix2 - rx1]
+        return Image.fromarray(canvas)
+
+    def grab_regions(self, regions) -> list:
+        return [self.grab(r) if r else None for r in regions]
+
+
+class SimulatedTransport(Transport):
+    """
+    仿真的“移动办公”：联系人栏显示当前联系人，聊天窗口显示最近几条消息，
+    搜索结果在点击坐标附近出现。所有动作按配置的延迟生效，并可注入故障。
+    """
+
+    def __init__(self, contacts: dict, seed: int = None, **options):
+        self.contacts = dict(contacts)
+        self.opts = dict(SIM_DEFAULTS, **options)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._events = []
+        self.search_open = False
+        self.search_text = ''
+        self.results = None
+        self.current = None
+        self.input_box = ''
+        self.chats = {phone: ["历史消息：您好"] for phone in self.contacts}
+        self.delivered = []
+        self.capture = SimulatedCapture(self)
+
+    # ---------- 仿真状态 ----------
+    def _delay(self, key: str) -> float:
+        base = self.opts[key]
+        return base * (1 + self._rng.uniform(-self.opts['jitter'], self.opts['jitter']))
+
+    def _schedule(self, key: str, action):
+        with self._lock:
+            self._events.append((time.monotonic() + self._delay(key), action))
+
+    def _apply_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = sorted((e for e in self._events if e[0] <= now), key=lambda e: e[0])
+            self._events = [e for e in self._events if e[0] > now]
+        for _, action in due:
+            action()
+
+    def render(self) -> list:
+        self._apply_due()
+        rc, rm, rr = SIM_LAYOUT['region_contact'], SIM_LAYOUT['region_message'], SIM_LAYOUT['region_results']
+        rs = SIM_LAYOUT['region_search_box']
+        size = lambda r: (r[2] - r[0], r[3] - r[1])
+        contact = self.contacts.get(self.current, '') if self.current else ''
+        chat = '\n'.join(self.chats.get(self.current, [])[-3:]) if self.current else ''
+        results = self.contacts.get(self.results, '') if self.results else ''
+        search = f"搜索：{self.search_text}" if self.search_open else ''
+        return [(rc, _encode(contact, size(rc))), (rm, _encode(chat, size(rm))), (rr, _encode(results, size(rr))),
+                (rs, _encode(search, size(rs)))]
+
+    def _open_result(self):
+        if not self.results:
+            return
+        target = self.results
+        if self._rng.random() < self.opts['search_miss_rate']:
+            target = self._rng.choice(list(self.contacts))
+        self.search_open, self.search_text, self.results = False, '', None
+
+        def switch():
+            self.current = target
+        self._schedule('open_latency', switch)
+
+    # ---------- Transport 接口 ----------
+    def open_search(self):
+        def show():
+            self.search_open, self.search_text, self.results = True, '', None
+        self._schedule('hotkey_latency', show)
+
+    def type_text(self, text: str):
+        self._apply_due()
+        if not self.search_open:
+            self.input_box += text
+            return
+        self.search_text += text
+        query = self.search_text
+
+        def show_results():
+            self.results = query if query in self.contacts else None
+        self._schedule('search_latency', show_results)
+
+    def click(self, x, y):
+        self._apply_due()
+        rx1, ry1, rx2, ry2 = SIM_LAYOUT['region_results']
+        if rx1 <= x < rx2 and ry1 <= y < ry2:
+            self._open_result()
+
+    def paste(self, text: str):
+        self._apply_due()
+        if not self.search_open:
+            self.input_box += text
+
+    def press_enter(self):
+        self._apply_due()
+        if self.search_open:
+            self._open_result()
+            return
+        message, phone = self.input_box, self.current
+        self.input_box = ''
+        if not message or phone is None or self._rng.random() < self.opts['send_drop_rate']:
+            return
+
+        def deliver():
+            self.chats[phone].append(message)
+            self.delivered.append((phone, message))
+        self._schedule('send_latency', deliver)
+
+
+def run_benchmark(messages: int = 50, pipeline: bool = False, seed: int = 0, cfg_overrides: dict = None,
+                  **sim_options) -> dict:
+    """用仿真后端发送 messages 条消息，返回吞吐量、误拒率等统计"""
+    rng = random.Random(seed)
+    contacts = {f"138{i:08d}": f"客户经理{i:03d}" for i in range(max(1, messages))}
+    items = []
+    for i, (phone, name) in enumerate(contacts.items()):
+        amount = rng.randint(100, 99999)
+        message = (f"客户经理{name}名下测试客户{i}于2024-01-01开具发票，票号{100000 + i}，"
+                   f"金额{amount}.0，逾期未回款30天以上，请尽快回款。")
+        items.append({"phone": phone, "name": name, "message": message, "notices": []})
+
+    transport = SimulatedTransport(contacts, seed=seed, **sim_options)
+    engine = SimulatedOCREngine(sim_options.get('ocr_error_rate', 0.0), seed=seed)
+    # 仿真画面直接编码文本，不做图像预处理
+    ocr_manager = OCRManager(engine=engine, capture=transport.capture, preprocess_steps=[])
+    cfg = dict(DEFAULT_CONFIG)
+    cfg.update({
+        "region_contact": SIM_LAYOUT['region_contact'],
+        "region_message": SIM_LAYOUT['region_message'],
+        "region_search": SIM_LAYOUT['region_search'],
+        "click_point": SIM_LAYOUT['click_point'],
+        "pipeline_verify": pipeline,
+        "max_retries": 2,
+    })
+    cfg.update(cfg_overrides or {})
+    sender = Sender(cfg, lambda msg: None, ocr_manager, transport)
+
+    # 记录每次消息校验结果与真实投递情况，统计误拒（实际已送达却判为失败）
+    checks = []
+    check_message = sender.check_message
+
+    def recording_check(message, text):
+        ok = check_message(message, text)
+        delivered = any(m == message for _, m in transport.delivered)
+        checks.append((ok, delivered))
+        return ok
+    sender.check_message = recording_check
+
+    results = []
+    start = time.monotonic()
+    sender.send_all(items, on_done=lambda item, ok: results.append(ok))
+    timings = SendTelemetry.summarize([item.get('timings') or {} for item in items], ocr_manager.drain_timings())
+    elapsed = time.monotonic() - start
+
+    sent_ok = sum(results)
+    genuine = [ok for ok, delivered in checks if delivered]
+    false_rejects = sum(1 for ok in genuine if not ok)
+    duplicates = len(transport.delivered) - len(set(transport.delivered))
+    return {
+        "messages": len(items),
+        "succeeded": sent_ok,
+        "elapsed_sec": elapsed,
+        "messages_per_min": sent_ok / elapsed * 60 if elapsed else 0.0,
+        "verifications": len(checks),
+        "false_reject_rate": false_rejects / len(genuine) if genuine else 0.0,
+        "duplicate_deliveries": duplicates,
+        "ocr_skipped": ocr_manager.gate_hits,
+        "timings": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="仿真发送吞吐量基准测试")
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--pipeline", action="store_true", help="启用流水线校验")
+    parser.add_argument("--fixed-wait", action="store_true", help="关闭自适应等待，使用固定等待")
+    parser.add_argument("--seed", type=int, default=0)
+    for key, value in SIM_DEFAULTS.items():
+        parser.add_argument("--" + key.replace('_', '-'), type=float, default=value)
+    args = parser.parse_args()
+
+    sim_options = {key: getattr(args, key) for key in SIM_DEFAULTS}
+    cfg_overrides = {"adaptive_wait": not args.fixed_wait}
+    report = run_benchmark(args.messages, pipeline=args.pipeline, seed=args.seed,
+                           cfg_overrides=cfg_overrides, **sim_options)
+    print(f"消息数: {report['messages']} | 成功: {report['succeeded']} | 用时: {report['elapsed_sec']:.1f}s")
+    print(f"吞吐量: {report['messages_per_min']:.1f} 条/分钟")
+    print(f"消息校验: {report['verifications']} 次 | 误拒率: {report['false_reject_rate']:.2%} "
+          f"| 重复投递: {report['duplicate_deliveries']} 条 | 画面未变化跳过 OCR: {report['ocr_skipped']} 次")
+    print("各步骤耗时:")
+    print(SendTelemetry.format_summary(report['timings']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import os
+import random
+import sys
+
+import pandas as pd
+import pytest
+
+# 模块位于仓库根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+EXTRACT_COLUMNS = ['发票状态', '发票总金额', '是否已完全销账', '发票号码', '提单人名称', '提单人工号', '客户经理名称', '客户名称', '开票日期']
+EXTRACT_AS_OF = pd.Timestamp('2024-06-30')
+
+
+@pytest.fixture
+def extract_files(tmp_path):
+    """(原始数据, 维度表, 剔除名单) 文件路径。真实格式的原始数据：首行为标题，第二行为列名；工号和开票日期为整数并夹杂空单元格"""
+    rng = random.Random(1)
+    dates = [int((EXTRACT_AS_OF - pd.Timedelta(days=k)).strftime('%Y%m%d')) for k in range(0, 150, 7)] + [None]
+    rows = [[rng.choice(['已开具', '已开具', '作废']), rng.choice([f"{rng.randint(1, 99999)}.5", f"¥{rng.randint(1, 5000)}"]),
+             rng.choice(['否', '否', '是']), f"INV{i}", rng.choice(['张三', '李四', None]), rng.choice([1001, 1002, None]),
+             rng.choice(['经理A', '经理B', None]), rng.choice(['客户甲', '客户乙', '客户丙', None]), rng.choice(dates)]
+            for i in range(600)]
+    raw_path = tmp_path / 'raw.xlsx'
+    pd.DataFrame([['标题'] + [None] * (len(EXTRACT_COLUMNS) - 1), EXTRACT_COLUMNS] + rows).to_excel(raw_path, index=False)
+
+    dim_path = tmp_path / 'dims.xlsx'
+    with pd.ExcelWriter(dim_path) as writer:
+        pd.DataFrame({'提单人名称': ['张三', '李四'], '提单人工号': [1001, 1002], '分公司': ['一分', '二分']}) \
+            .to_excel(writer, index=False, sheet_name='a')
+        pd.DataFrame({'客户经理': ['经理A', '经理B'], '分公司': ['三分', '四分'], '对应工号': [1, 2],
+                      '集团名称': ['客户甲', '客户乙']}).to_excel(writer, index=False, sheet_name='b')
+        pd.DataFrame({'客户名称': ['客户丙'], '分公司': ['五分']}).to_excel(writer, index=False, sheet_name='c')
+        pd.DataFrame({'姓名': ['经理A', '经理B'], '总监': ['总监X', '总监Y'], '总监电话': ['13800000001', '13800000002'],
+                      '分管领导': ['领导L', '领导M'], '分管领导电话': ['13900000001', '13900000002'],
+                      '联系电话': ['13700000001', '13700000002']}).to_excel(writer, index=False, sheet_name='d')
+    exclude_path = tmp_path / 'excl.xlsx'
+    pd.DataFrame({'发票号码': ['INV1', 'INV2']}).to_excel(exclude_path, index=False)
+    return str(raw_path), str(dim_path), str(exclude_path)
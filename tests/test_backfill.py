@@ -0,0 +1,51 @@
+"""多日期账龄回填与逐日运行 transform 的数据汇总一致"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import excel_pipeline
+
+
+@pytest.fixture(scope="module")
+def matched():
+    rng = np.random.default_rng(3)
+    n = 400
+    raw = pd.DataFrame({
+        '发票状态': '已开具',
+        '发票总金额': np.round(rng.uniform(1, 1e5, n), 2),
+        '是否已完全销账': '否',
+        '发票号码': [f"INV{i}" for i in range(n)],
+        '提单人名称': rng.choice(['张三', '李四', '王五'], n),
+        '提单人工号': rng.choice([1, 2, 3], n),
+        '客户经理名称': rng.choice(['经理A', '经理B'], n),
+        '客户名称': rng.choice(['客户1', '客户2'], n),
+        '开票日期': [(pd.Timestamp('2024-01-01') + pd.Timedelta(days=int(k))).strftime('%Y%m%d')
+                     for k in rng.integers(0, 240, n)],
+    })
+    dims = excel_pipeline.DimensionIndex(
+        pd.DataFrame({'提单人名称': ['张三', '李四'], '提单人工号': [1, 2], '分公司': ['北区', '南区']}),
+        pd.DataFrame({'客户经理': ['经理A'], '分公司': ['东区'], '对应工号': [1], '集团名称': ['客户1']}),
+        pd.DataFrame({'客户名称': ['客户2'], '分公司': ['西区']}),
+        pd.DataFrame({'姓名': ['经理A'], '总监': ['总监1'], '总监电话': ['1'], '分管领导': ['L1'],
+                      '分管领导电话': ['2'], '联系电话': ['3']}),
+    )
+    return raw, dims
+
+
+# 每块只放几个统计日期，覆盖分块边界
+@pytest.mark.parametrize("options", [{}, {"max_cells": 1000}], ids=["default", "small_blocks"])
+def test_backfill_matches_daily_transform(matched, options):
+    raw, dims = matched
+    quiet = lambda *_: None
+    dates = pd.date_range('2023-12-25', '2024-10-01', freq='6D')
+    df, _, _ = excel_pipeline.match_and_date(raw, dims, [], quiet)
+    trend = excel_pipeline.backfill_aging(df, dates, **options)
+    assert trend.index.get_level_values('统计日期').nunique() < len(dates)   # 首个日期尚无发票
+    for date in dates:
+        expected = excel_pipeline.transform(raw, dims, [], quiet, as_of=date)['数据汇总']
+        if expected.empty:
+            assert date not in trend.index.get_level_values('统计日期')
+            continue
+        actual = trend.xs(date, level='统计日期')
+        pd.testing.assert_frame_equal(actual, expected, check_names=False, check_index_type=False,
+                                      check_column_type=False, rtol=1e-9)
@@ -0,0 +1,25 @@
+"""关联键标准化：数值与数字文本互相匹配，布尔值不与 1 / 0 混同"""
+import numpy as np
+import pandas as pd
+
+import excel_pipeline
+from excel_pipeline import normalize_key
+
+
+def test_numeric_forms_share_a_key():
+    assert {normalize_key(v) for v in [1001, 1001.0, np.int64(1001), "1001", "1001.0", "１００１ "]} == {"1001"}
+    assert normalize_key(np.nan) is None and normalize_key("  ") is None and normalize_key(None) is None
+
+
+def test_bools_are_not_conflated_with_numbers():
+    # 先缓存 1 / 0，再查 True / False，不能命中同一缓存项
+    assert normalize_key(1) == "1" and normalize_key(0) == "0"
+    assert normalize_key(True) == "TRUE" and normalize_key(np.bool_(False)) == "FALSE"
+    assert normalize_key(1.0) == "1"
+
+
+def test_normalize_keys_keeps_bools_apart_from_numbers():
+    series = pd.Series([1, True, 1.0, "1", False, 0, None, True], index=list("abcdefgh"), dtype=object)
+    expected = ["1", "TRUE", "1", "1", "FALSE", "0", None, "TRUE"]
+    assert excel_pipeline.normalize_keys(series).tolist() == expected
+    assert excel_pipeline.normalize_keys(series[::-1]).tolist() == expected[::-1]
@@ -0,0 +1,65 @@
+"""OCRManager.partial_ratio（Myers 位并行）与逐格动态规划的半全局编辑距离一致"""
+import random
+
+import pytest
+
+from sender_app import OCRManager
+
+
+def reference_ratio(pattern: str, text: str) -> float:
+    """pattern 整体与 text 任意片段的最小编辑距离（片段起止位置不计代价），按 1 - 距离 / len(pattern) 换算"""
+    pattern, text = pattern.strip(), text.strip()
+    m = len(pattern)
+    if not m or not text:
+        return 0.0
+    # prev[i]：pattern 前 i 个字符与以当前位置结尾的 text 片段的最小编辑距离
+    prev = list(range(m + 1))
+    best = prev[m]
+    for ch in text:
+        cur = [0] * (m + 1)
+        for i in range(1, m + 1):
+            cur[i] = min(prev[i] + 1, cur[i - 1] + 1, prev[i - 1] + (pattern[i - 1] != ch))
+        prev = cur
+        best = min(best, cur[m])
+    return 1.0 - best / m
+
+
+ALPHABETS = ["ab", "abcd", "0123456789", "客户经理张三李四王五于开具发票金额回款"]
+
+
+def _cases(seed, count, max_len):
+    rng = random.Random(seed)
+    for _ in range(count):
+        alphabet = rng.choice(ALPHABETS)
+        pattern = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, max_len)))
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, max_len * 2)))
+        if rng.random() < 0.5:
+            # 在 text 中嵌入 pattern 的一个变体，覆盖相似度较高的情况
+            noisy = ''.join(c for c in pattern if rng.random() > 0.1)
+            cut = rng.randint(0, len(text))
+            text = text[:cut] + noisy + text[cut:]
+        yield pattern, text
+
+
+@pytest.mark.parametrize("seed, count, max_len", [(0, 400, 12), (1, 60, 150)], ids=["short", "multi_word"])
+def test_matches_reference(seed, count, max_len):
+    # multi_word 的 pattern 长度超过 64，位向量跨越多个机器字
+    for pattern, text in _cases(seed, count, max_len):
+        assert OCRManager.partial_ratio(pattern, text) == pytest.approx(reference_ratio(pattern, text))
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.8, 0.95, 1.0])
+def test_threshold_early_exit_keeps_decision(threshold):
+    for pattern, text in _cases(2, 200, 90):
+        expected = reference_ratio(pattern, text)
+        actual = OCRManager.partial_ratio(pattern, text, threshold)
+        assert (actual >= threshold - 1e-9) == (expected >= threshold - 1e-9)
+        assert actual <= expected + 1e-9
+
+
+def test_cjk_message_in_ocr_text():
+    message = "客户经理张三名下测试客户于2024-01-01开具发票，票号100001，金额12345.0，逾期未回款30天以上，请尽快回款。"
+    ocr = "13:05 张三\n" + message.replace("票", "栗", 2).replace("，", ",") + "\n已读"
+    assert OCRManager.partial_ratio(message, ocr) == pytest.approx(reference_ratio(message, ocr))
+    assert OCRManager.partial_ratio(message, ocr) > 0.8
+    assert OCRManager.partial_ratio("", ocr) == 0.0 and OCRManager.partial_ratio(message, "  ") == 0.0
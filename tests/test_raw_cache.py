@@ -0,0 +1,54 @@
+"""原始数据解析缓存：命中缓存时的处理结果与直接解析 Excel 相同"""
+import pandas as pd
+import pytest
+
+import excel_pipeline
+
+# 与 extract_files 生成的开票日期对应
+AS_OF = pd.Timestamp('2024-06-30')
+
+
+@pytest.fixture
+def cache_config(tmp_path, monkeypatch):
+    monkeypatch.setitem(excel_pipeline.PIPELINE_CONFIG, 'raw_cache', True)
+    monkeypatch.setitem(excel_pipeline.PIPELINE_CONFIG, 'raw_cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.setitem(excel_pipeline.PIPELINE_CONFIG, 'parallel_load', 'off')
+    return tmp_path / 'cache'
+
+
+@pytest.mark.skipif(not excel_pipeline.PARQUET_AVAILABLE, reason="需要 pyarrow 才会走 parquet 缓存")
+def test_warm_run_matches_cold_run(tmp_path, extract_files, cache_config):
+    lines = []
+    results = []
+    for tag in ('cold', 'warm'):
+        save_dir = tmp_path / tag
+        save_dir.mkdir()
+        path = excel_pipeline.run_pipeline(*extract_files, str(save_dir), lines.append, tag=tag, as_of=AS_OF)
+        results.append(pd.read_excel(path, sheet_name=None))
+    assert any('使用解析缓存' in line for line in lines)
+    assert list(cache_config.iterdir())
+
+    cold, warm = results
+    assert list(warm) == list(cold)
+    for name in cold:
+        pd.testing.assert_frame_equal(warm[name], cold[name], check_dtype=False)
+    assert len(cold['数据汇总']) > 0
+    assert any(len(cold[name]) > 0 for name in cold if name.endswith('通报'))
+
+
+@pytest.mark.skipif(not excel_pipeline.PARQUET_AVAILABLE, reason="需要 pyarrow")
+def test_parquet_only_for_plain_text_columns(tmp_path):
+    cache = excel_pipeline.RawCache(str(tmp_path), 1 << 30)
+    text = pd.DataFrame({'发票号码': ['A1', 'A2'], '发票总金额': [1.5, 2.0]}).astype({'发票号码': object})
+    mixed = pd.DataFrame({'开票日期': [20240115, None], '提单人工号': [1001, 'E9']}, dtype=object)
+    assert excel_pipeline.RawCache.parquet_safe(text)
+    assert not excel_pipeline.RawCache.parquet_safe(mixed)
+
+    cache.put('text', text)
+    cache.put('mixed', mixed)
+    assert (tmp_path / 'text.parquet').exists()
+    assert (tmp_path / 'mixed.pkl').exists()
+    pd.testing.assert_frame_equal(cache.get('text'), text)
+    restored = cache.get('mixed')
+    assert restored['开票日期'].tolist()[0] == 20240115
+    assert type(restored['开票日期'].tolist()[0]) is int
@@ -0,0 +1,101 @@
+"""发送计划的分组、去重和拆分，以及令牌桶限速"""
+import pytest
+
+from send_plan import ROLE_DIRECTOR, ROLE_LEADER, ROLE_MANAGER, TokenBucket, build_send_plan
+
+
+def notice(phone, message, sheet="30天通报", row=0, role=ROLE_MANAGER, name="经理A", amount=100.0, days=40):
+    return {"sheet": sheet, "row": row, "role": role, "name": name, "phone": phone, "message": message,
+            "amount": amount, "days": days}
+
+
+def test_groups_by_phone_in_first_seen_order():
+    plan = build_send_plan([
+        notice("13800000001", "m1", row=0),
+        notice("13800000002", "m2", row=1, name="经理B"),
+        notice("13800000001", "m3", row=2, amount=50.0, days=70),
+    ])
+    assert [item['phone'] for item in plan] == ["13800000001", "13800000002"]
+    first = plan[0]
+    assert first['message'] == "m1\nm3"
+    assert first['amount'] == 150.0 and first['days'] == 70
+    assert [n['row'] for n in first['notices']] == [0, 2]
+
+
+def test_duplicate_message_for_same_phone_is_sent_once():
+    # 同一人既是客户经理又是总监时，同一行的同一条消息只发一次，金额按行去重
+    plan = build_send_plan([
+        notice("13800000001", "m1", role=ROLE_MANAGER, name=""),
+        notice("13800000001", "m1", role=ROLE_DIRECTOR, name="总监X"),
+        notice("13800000001", "m1", sheet="60天通报", row=5, role=ROLE_LEADER, amount=30.0),
+    ])
+    assert len(plan) == 1
+    item = plan[0]
+    assert item['message'] == "m1"
+    assert len(item['notices']) == 3
+    assert item['name'] == "总监X"
+    assert item['role'] == f"{ROLE_MANAGER}、{ROLE_DIRECTOR}、{ROLE_LEADER}"
+    assert item['role_rank'] == 0
+    assert item['amount'] == 130.0
+
+
+@pytest.mark.parametrize("max_len, expected", [
+    # "aaaa\nbbbb" 恰好 9 个字符：等于 max_len 时合并，少一个字符即拆分
+    (9, ["aaaa\nbbbb", "cccc"]),
+    (8, ["aaaa", "bbbb", "cccc"]),
+    (14, ["aaaa\nbbbb\ncccc"]),
+    (13, ["aaaa\nbbbb", "cccc"]),
+])
+def test_max_len_split_boundary(max_len, expected):
+    notices = [notice("13800000001", m, row=i) for i, m in enumerate(["aaaa", "bbbb", "cccc"])]
+    plan = build_send_plan(notices, max_len=max_len)
+    assert [item['message'] for item in plan] == expected
+    assert all(len(item['message']) <= max_len for item in plan)
+    assert sum(len(item['notices']) for item in plan) == 3
+
+
+def test_without_consolidation_each_message_is_separate():
+    notices = [notice("13800000001", m, row=i) for i, m in enumerate(["a", "b", "a"])]
+    plan = build_send_plan(notices, consolidate=False)
+    assert [item['message'] for item in plan] == ["a", "b"]
+    assert [len(item['notices']) for item in plan] == [2, 1]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_burst_then_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_min=30, burst=2, clock=clock, sleep=clock.sleep)
+    # 桶初始装满，可连续取 burst 个
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    # 之后按每 2 秒一个的速率等待
+    assert bucket.acquire() == pytest.approx(2.0)
+    assert bucket.acquire() == pytest.approx(2.0)
+    assert clock.sleeps == [pytest.approx(2.0)] * 2
+
+
+def test_token_bucket_refills_while_idle_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_min=60, burst=3, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.acquire()
+    # 空闲 1.5 秒补回 1.5 个令牌：取 1 个不等待，再取需等剩余的 0.5 秒
+    clock.now += 1.5
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.5)
+    # 空闲很久也最多补满 burst 个
+    clock.now += 100
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.acquire() == pytest.approx(1.0)
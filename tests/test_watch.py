@@ -0,0 +1,22 @@
+"""监控模式：输出目录与监控目录相同时不把自己写出的结果文件当作原始数据"""
+import shutil
+
+import excel_pipeline
+
+
+def test_results_in_watched_folder_are_not_reprocessed(tmp_path, extract_files, monkeypatch):
+    monkeypatch.setitem(excel_pipeline.PIPELINE_CONFIG, 'raw_cache', False)
+    monkeypatch.setitem(excel_pipeline.PIPELINE_CONFIG, 'parallel_load', 'off')
+    raw_path, dim_path, exclude_path = extract_files
+    folder = tmp_path / 'inbox'
+    folder.mkdir()
+    shutil.copy(raw_path, folder / 'raw.xlsx')
+    quiet = lambda *_: None
+
+    processed = excel_pipeline.watch_folder(str(folder), dim_path, exclude_path, str(folder), stable_polls=1,
+                                            log=quiet, once=True)
+    assert list(processed) == ['raw.xlsx'] and 'result' in processed['raw.xlsx']
+    processed = excel_pipeline.watch_folder(str(folder), dim_path, exclude_path, str(folder), stable_polls=1,
+                                            log=quiet, once=True)
+    assert list(processed) == ['raw.xlsx']
+    assert len([p for p in folder.iterdir() if p.name.startswith(excel_pipeline.RESULT_PREFIX)]) == 1